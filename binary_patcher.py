@@ -3,12 +3,24 @@
 import struct
 import subprocess
 from pathlib import Path
-from typing import Annotated
+from typing import Annotated, List, Optional
 
 import typer
 
+from rp2350_lfi.flash_regions import (
+    FIRMWARE_OFFSET,
+    FIRMWARE_REGION,
+    FlashRegion,
+    FlashRegionIndex,
+)
+
 app = typer.Typer()
 
+VECTOR_TABLE_SIZE = (16 + 52) * 4  # Cortex-M33 system exceptions + RP2350 IRQs
+
+PICOBIN_BLOCK_MARKER_START = 0xFFFFDED3
+PICOBIN_BLOCK_MARKER_END = 0xAB123579
+
 
 def generate_jumper_shellcode(
     filename: str = "rp2350_lfi/assets/jumper.s",
@@ -25,6 +37,64 @@ def generate_jumper_shellcode(
         return f.read()
 
 
+def find_blocks(data: bytes) -> List[FlashRegion]:
+    """Find the picobin blocks (IMAGE_DEF, signature...) of an image."""
+    blocks = []
+    start = None
+    for offset in range(0, len(data) - 3, 4):
+        (word,) = struct.unpack_from("<I", data, offset)
+        if word == PICOBIN_BLOCK_MARKER_START:
+            start = offset
+        elif word == PICOBIN_BLOCK_MARKER_END and start is not None:
+            blocks.append(FlashRegion(start, offset + 4, "image_def"))
+            start = None
+    return blocks
+
+
+def image_regions(
+    data: bytes,
+    base: int,
+    signature_block_address: int,
+    prefix: str = "",
+    size: Optional[int] = None,
+) -> List[FlashRegion]:
+    """Describe the regions of a vanilla image written at a given offset.
+
+    Args:
+        data (bytes): The vanilla image.
+        base (int): Flash offset of the image.
+        signature_block_address (int): Offset of the signature block in the image.
+        prefix (str, optional): Prefix of the region names. Defaults to "".
+        size (int, optional): Only the first bytes of the image are written.
+    """
+    if size is None:
+        size = len(data)
+
+    regions = [
+        FlashRegion(base, base + size, f"{prefix}code"),
+        FlashRegion(base, base + min(size, VECTOR_TABLE_SIZE), f"{prefix}vector_table"),
+    ]
+    for block in find_blocks(data[:size]):
+        regions.append(
+            FlashRegion(base + block.start, base + block.end, f"{prefix}{block.name}")
+        )
+
+    if signature_block_address < size:
+        # The signature block ends with the first block end marker following it
+        signature_block_end = len(data)
+        for block in find_blocks(data):
+            if block.start <= signature_block_address < block.end:
+                signature_block_end = block.end
+        regions.append(
+            FlashRegion(
+                base + signature_block_address,
+                base + min(size, signature_block_end),
+                f"{prefix}signature_block",
+            )
+        )
+    return regions
+
+
 @app.command()
 def generate_binaries(
     vanilla_binary: Annotated[Path, typer.Option(help="Vanilla binary image")],
@@ -36,6 +106,12 @@ def generate_binaries(
             help="Flash address (offset) of the signature block of the vanilla image"
         ),
     ],
+    firmware: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Arbitrary firmware binary image, only used to describe the regions of flash 1"
+        ),
+    ] = None,
 ) -> None:
     """Generate the flash images corresponding to several RP2350 Exploit Scenario."""
     shellcode = generate_jumper_shellcode()
@@ -64,6 +140,17 @@ def generate_binaries(
 
     flash_0.write_bytes(flash_0_data)
 
+    flash_0_regions = image_regions(vanilla_binary_data, 0, signature_block_address)
+    flash_0_regions += [
+        FlashRegion(signature_block_address - 4, signature_block_address, "block_link"),
+        FlashRegion(
+            reset_hander_offset, reset_hander_offset + len(shellcode), "shellcode"
+        ),
+    ]
+    FlashRegionIndex.from_layers(flash_0_regions).save(
+        flash_0.with_suffix(".regions.json")
+    )
+
     flash_1_data = vanilla_binary_data[:signature_block_address]
     flash_1_data += vanilla_binary_data
 
@@ -77,6 +164,35 @@ def generate_binaries(
 
     flash_1.write_bytes(flash_1_data)
 
+    copy_end = signature_block_address + len(vanilla_binary_data)
+    flash_1_regions = image_regions(
+        vanilla_binary_data,
+        0,
+        signature_block_address,
+        size=signature_block_address,
+    )
+    flash_1_regions += image_regions(
+        vanilla_binary_data,
+        signature_block_address,
+        signature_block_address,
+        prefix="copy_",
+    )
+    flash_1_regions.append(FlashRegion(copy_end, 0x7000, "padding"))
+    flash_1_regions += image_regions(
+        vanilla_binary_data, 0x7000, signature_block_address, prefix="xip_"
+    )
+    if firmware is not None:
+        flash_1_regions.append(
+            FlashRegion(
+                FIRMWARE_OFFSET,
+                FIRMWARE_OFFSET + firmware.stat().st_size,
+                FIRMWARE_REGION,
+            )
+        )
+    FlashRegionIndex.from_layers(flash_1_regions).save(
+        flash_1.with_suffix(".regions.json")
+    )
+
 
 if __name__ == "__main__":
     app()
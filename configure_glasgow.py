@@ -2,7 +2,13 @@
 
 import argparse
 import asyncio
+import hashlib
+import importlib.metadata
+import inspect
+import json
 import logging
+import tomllib
+from pathlib import Path
 
 from glasgow.access.direct import (
     DirectArguments,
@@ -26,26 +32,48 @@ def pinargs(x):
     return r
 
 
-async def _main():
+def applet_source_hash():
+    """Hash the source of the applet, which the gateware is generated from."""
+    source = Path(inspect.getsourcefile(Rp2350LfiApplet))
+    if source.name == "__init__.py":
+        files = sorted(source.parent.rglob("*.py"))
+    else:
+        files = [source]
+
+    h = hashlib.sha256()
+    for f in files:
+        h.update(f.read_bytes())
+    return h.hexdigest()
+
+
+def bitstream_cache_key(revision, io_level, rp2350_pins, ctrl_endpoint):
+    """Identify a bitstream by everything it is built from.
+
+    The Glasgow version is part of the key, as the gateware shared by all the
+    applets (multiplexer, demultiplexer) must match the host code.
+    """
+    key = {
+        "revision": revision,
+        "io_level": io_level,
+        "pins": rp2350_pins,
+        "endpoint": ctrl_endpoint,
+        "applet": applet_source_hash(),
+        "glasgow": importlib.metadata.version("glasgow"),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+async def _main(args):
+    with args.config.open("rb") as f:
+        config = tomllib.load(f)
+
     device = GlasgowHardwareDevice()
 
-    io_level = 3.3  # V
-
-    rp2350_pins = {
-        "run": 2,
-        "power-en": 3,
-        "qspi-ss": 4,  # also bootsel
-        "qspi-clk": 8,  # B0
-        "qspi-d0": 9,  # B1
-        "qspi-d1": 10,  # B2
-        "qspi-d2": 11,  # B3
-        "qspi-d3": 12,  # B4
-        "flash-ss1": 5,
-        "flash-ss2": 6,
-        "laser": 13,  # B5
-    }
+    io_level = config["io_level"]  # V
+
+    rp2350_pins = config["pins"]
 
-    ctrl_endpoint = "tcp::3334"
+    ctrl_endpoint = config["endpoint"]
 
     logger.info(f"{ctrl_endpoint = }")
 
@@ -77,9 +105,29 @@ async def _main():
 
     rp2350.build(target, rp2350_args)
 
-    plan = target.build_plan()
-
-    await device.download_target(plan)
+    cache_key = bitstream_cache_key(
+        device.revision, io_level, rp2350_pins, ctrl_endpoint
+    )
+    bitstream_file = args.cache_dir / f"{cache_key}.bin"
+    bitstream_id_file = args.cache_dir / f"{cache_key}.id"
+
+    if not args.rebuild and bitstream_file.exists() and bitstream_id_file.exists():
+        logger.info(f"Using cached bitstream {cache_key}")
+        bitstream_id = bitstream_id_file.read_bytes()
+        if await device.bitstream_id() == bitstream_id:
+            logger.info("Device already has this bitstream")
+        else:
+            await device.download_bitstream(bitstream_file.read_bytes(), bitstream_id)
+    else:
+        logger.info("Building bitstream")
+        plan = target.build_plan()
+        bitstream = plan.execute()
+
+        args.cache_dir.mkdir(parents=True, exist_ok=True)
+        bitstream_file.write_bytes(bitstream)
+        bitstream_id_file.write_bytes(plan.bitstream_id)
+
+        await device.download_bitstream(bitstream, plan.bitstream_id)
 
     device.demultiplexer = DirectDemultiplexer(device, target.multiplexer.pipe_count)
 
@@ -110,10 +158,30 @@ async def _main():
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Configure the Glasgow board")
+    parser.add_argument(
+        "--config",
+        type=Path,
+        default=Path(__file__).parent / "glasgow.toml",
+        help="Pin map, I/O voltage and control endpoint",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=Path.home() / ".cache" / "rp2350-lfi" / "bitstreams",
+        help="Bitstream cache directory",
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Ignore the bitstream cache and rebuild the gateware",
+    )
+    args = parser.parse_args()
+
     root_logger = logging.getLogger()
     term_handler = logging.StreamHandler()
     root_logger.addHandler(term_handler)
-    exit(asyncio.new_event_loop().run_until_complete(_main()))
+    exit(asyncio.new_event_loop().run_until_complete(_main(args)))
 
 
 if __name__ == "__main__":
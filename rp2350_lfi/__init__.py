@@ -1,8 +1,69 @@
 #!/usr/bin/env python3
 """RP2350 LFI Project."""
 
-__all__ = ["LaserPulser", "DeltaStage", "FpgaController"]
+__all__ = [
+    "AttemptEvents",
+    "AttemptOutcome",
+    "AttemptRecord",
+    "AttemptRing",
+    "Calibration",
+    "Capability",
+    "CapturePipeline",
+    "ConsoleWatcher",
+    "LaserPulser",
+    "PauseReason",
+    "DeltaStage",
+    "FpgaCapabilityError",
+    "FpgaController",
+    "FlashRegion",
+    "FlashRegionIndex",
+    "FpgaLinkError",
+    "Picotool",
+    "QspiTrace",
+    "QspiTraceStore",
+    "RecoveryAction",
+    "ScheduleEntry",
+    "TargetHealthMonitor",
+    "Telemetry",
+    "TelemetryExporter",
+    "WorkerConfig",
+    "build_mosaic",
+    "describe_address",
+    "finish_attempt",
+    "precedes_signature_block",
+    "recommend_timeout",
+    "retry_on_link_error",
+    "run_worker",
+    "start_attempt",
+    "watch_reads",
+]
 
+from .attack_worker import WorkerConfig, run_worker
+from .attempt import (
+    AttemptEvents,
+    AttemptOutcome,
+    describe_address,
+    finish_attempt,
+    precedes_signature_block,
+    start_attempt,
+    watch_reads,
+)
+from .attempt_ring import AttemptRecord, AttemptRing, PauseReason
+from .calibration import Calibration, recommend_timeout
+from .capture_pipeline import CapturePipeline, build_mosaic
+from .console_watcher import ConsoleWatcher
 from .delta_stage import DeltaStage
-from .fpga_controller import FpgaController
+from .flash_regions import FlashRegion, FlashRegionIndex
+from .fpga_controller import (
+    Capability,
+    FpgaCapabilityError,
+    FpgaController,
+    FpgaLinkError,
+    ScheduleEntry,
+    retry_on_link_error,
+)
 from .laser_pulser import LaserPulser
+from .picotool import Picotool
+from .qspi_trace import QspiTrace, QspiTraceStore
+from .target_health import RecoveryAction, TargetHealthMonitor
+from .telemetry import Telemetry, TelemetryExporter
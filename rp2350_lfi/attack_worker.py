@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""Real-time attack worker, running the glitch attempts in a dedicated process."""
+
+import gc
+import os
+import signal
+import time
+from dataclasses import dataclass
+from typing import List, Optional
+
+from .attempt import (
+    AttemptOutcome,
+    finish_attempt,
+    precedes_signature_block,
+    start_attempt,
+    watch_reads,
+)
+from .attempt_ring import AttemptRecord, AttemptRing, PauseReason
+from .calibration import Calibration
+from .flash_regions import FlashRegionIndex
+from .fpga_controller import FpgaController, retry_on_link_error
+from .target_health import TargetHealthMonitor
+
+
+@dataclass
+class WorkerConfig:
+    """Configuration of the attack worker."""
+
+    delays: List[int]
+    n_retries: int
+    timings: Calibration
+    health_threshold: int = 5
+    cpu: Optional[int] = None  # CPU the worker is pinned to
+    gc_interval: int = 1000  # Number of attempts between two garbage collections
+    regions: Optional[FlashRegionIndex] = None  # Region index of the monitored flash
+    watch_reads: bool = True  # Watch the QSPI reads after XIP data has been read
+
+
+def _attempt(
+    ctrl: FpgaController,
+    ring: AttemptRing,
+    number: int,
+    delay: int,
+    config: WorkerConfig,
+) -> AttemptRecord:
+    timings = config.timings
+    events = start_attempt(
+        ctrl, timings.poweroff_duration, timings.success_timeout, timings.xip_timeout
+    )
+
+    start_address = 0
+    max_address = 0
+    paused = False
+    if events.outcome >= AttemptOutcome.SUCCESS:
+        start_address = ctrl.get_start_address()
+        if events.outcome == AttemptOutcome.XIP and config.watch_reads:
+            paused, max_address = watch_reads(
+                ctrl, config.regions, stopped=lambda: ring.stop
+            )
+        else:
+            max_address = ctrl.get_max_address()
+            paused = events.outcome == AttemptOutcome.XIP
+        paused = paused or precedes_signature_block(max_address, config.regions)
+
+    # The target is left running until the control plane has assessed the
+    # situation.
+    if not paused:
+        finish_attempt(ctrl)
+
+    return AttemptRecord(
+        number,
+        time.time(),
+        events.done_latency,
+        events.success_latency,
+        start_address,
+        max_address,
+        delay,
+        events.outcome,
+        paused,
+    )
+
+
+def _wait_resume(ring: AttemptRing) -> None:
+    while ring.paused and not ring.stop:
+        time.sleep(0.01)
+
+
+def _pause(ring: AttemptRing, reason: PauseReason) -> None:
+    ring.paused = reason
+    _wait_resume(ring)
+
+
+def run_worker(ring: AttemptRing, config: WorkerConfig) -> None:
+    """Run glitch attempts until stopped, and push their records to a ring.
+
+    The worker owns the connection to the gateware. It is controlled through
+    the "paused" and "stop" flags of the ring. It pauses by itself after each
+    attempt needing an assessment, leaving the target powered, as well as when
+    the target cannot be recovered.
+
+    Args:
+        ring (AttemptRing): The ring, inherited from the control plane process.
+        config (WorkerConfig): Configuration of the worker.
+    """
+    # Interruptions are handled by the control plane, through the stop flag
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if config.cpu is not None:
+        os.sched_setaffinity(0, {config.cpu})
+
+    ctrl = FpgaController()
+
+    ctrl.set_power(False)
+    ctrl.set_bootsel(True)
+    ctrl.set_run(True)
+    ctrl.cancel_glitch_engine()
+
+    health_monitor = TargetHealthMonitor(
+        ctrl,
+        on_pause=lambda: _pause(ring, PauseReason.RECOVERY),
+        threshold=config.health_threshold,
+    )
+
+    # Garbage collection only happens between attempts, at a fixed interval
+    gc.collect()
+    gc.freeze()
+    gc.disable()
+
+    number = 0
+    try:
+        while not ring.stop:
+            for delay in config.delays:
+                retry_on_link_error(ctrl, lambda: ctrl.set_trigger_delay(delay))
+
+                for _ in range(config.n_retries):
+                    if ring.stop:
+                        return
+
+                    record = retry_on_link_error(
+                        ctrl, lambda: _attempt(ctrl, ring, number, delay, config)
+                    )
+                    if record.paused:
+                        ring.paused = PauseReason.ATTEMPT
+                    if not ring.push(record):
+                        ring.paused = PauseReason.NONE
+
+                    if record.paused:
+                        _wait_resume(ring)
+                        retry_on_link_error(ctrl, lambda: finish_attempt(ctrl))
+
+                    outcome = AttemptOutcome(record.outcome)
+                    retry_on_link_error(ctrl, lambda: health_monitor.record(outcome))
+
+                    ring.publish_link(ctrl.link_latency, ctrl.reconnect_count)
+                    ring.publish_recovery(health_monitor.stats)
+
+                    number += 1
+                    if number % config.gc_interval == 0:
+                        gc.collect()
+    finally:
+        gc.enable()
+        finish_attempt(ctrl)
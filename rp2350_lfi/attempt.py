@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Single glitch attempt, shared by the attack loops and the calibration."""
+
+import logging
+import math
+import time
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Callable, Optional, Tuple
+
+from .flash_regions import (
+    FIRMWARE_OFFSET,
+    FIRMWARE_REGION,
+    FLASH_SIZE,
+    FlashRegionIndex,
+)
+from .fpga_controller import FpgaController
+
+logger = logging.getLogger(__name__)
+
+
+class AttemptOutcome(IntEnum):
+    """Outcome of a single glitch attempt."""
+
+    NO_TRIGGER = 0  # The glitch engine has not triggered
+    ANOMALY = 1  # Unexpected reply from the gateware
+    NO_SUCCESS = 2  # No QSPI read after the laser pulse
+    SUCCESS = 3  # Possible glitch success, another flash byte has been read
+    XIP = 4  # XIP data of the arbitrary firmware has been read
+    CONSOLE = 5  # The console of the arbitrary firmware has been detected
+
+    @property
+    def healthy(self) -> bool:
+        """Whether this outcome shows the target booted as expected."""
+        return self not in (AttemptOutcome.NO_TRIGGER, AttemptOutcome.ANOMALY)
+
+
+@dataclass
+class AttemptEvents:
+    """Glitch events of a single attempt.
+
+    Latencies are expressed in seconds, and are NaN when the corresponding event
+    has not been received.
+    """
+
+    outcome: AttemptOutcome
+    done_latency: float = math.nan  # From power on to the D event
+    success_latency: float = math.nan  # From the D event to the S event
+    xip_latency: float = math.nan  # From the S event to the X event
+    schedule_index: Optional[int] = None  # Schedule entry used, if any
+
+
+def start_attempt(
+    ctrl: FpgaController,
+    poweroff_duration: float,
+    success_timeout: float,
+    xip_timeout: float,
+) -> AttemptEvents:
+    """Arm the glitch engine, power the target on and wait for the glitch events.
+
+    The target is left powered, so that its QSPI reads can still be inspected.
+    The attempt is then ended with finish_attempt().
+
+    After an unexpected reply, late events or acknowledgements may still be in
+    flight, so the connection cannot be trusted anymore. A new one discards them,
+    and the state of the gateware is restored, which powers the target off.
+
+    Args:
+        ctrl (FpgaController): Interface to the gateware.
+        poweroff_duration (float): Power-off duration before the attempt (seconds).
+        success_timeout (float): How long to wait for the S event (seconds).
+        xip_timeout (float): How long to wait for the X event (seconds).
+
+    Returns:
+        AttemptEvents: The glitch events. The outcome is at most XIP.
+    """
+    events = AttemptEvents(AttemptOutcome.NO_TRIGGER)
+
+    try:
+        ctrl.arm_glitch_engine()
+        time.sleep(poweroff_duration)
+        t_power = time.perf_counter()
+        ctrl.set_power(True)
+
+        events.schedule_index = ctrl.wait_glitch_done()
+        t_done = time.perf_counter()
+        events.done_latency = t_done - t_power
+        events.outcome = AttemptOutcome.NO_SUCCESS
+
+        ctrl.wait_glitch_success(timeout=success_timeout)
+        t_success = time.perf_counter()
+        events.success_latency = t_success - t_done
+        events.outcome = AttemptOutcome.SUCCESS
+
+        ctrl.wait_xip_success(timeout=xip_timeout)
+        events.xip_latency = time.perf_counter() - t_success
+        events.outcome = AttemptOutcome.XIP
+    except TimeoutError:
+        pass
+    except ValueError as e:
+        _resynchronize(ctrl, e)
+        events.outcome = AttemptOutcome.ANOMALY
+
+    return events
+
+
+def finish_attempt(ctrl: FpgaController) -> None:
+    """Cancel the glitch engine and power the target off."""
+    try:
+        ctrl.cancel_glitch_engine()
+        ctrl.set_power(False)
+    except ValueError as e:
+        _resynchronize(ctrl, e)
+
+
+def watch_reads(
+    ctrl: FpgaController,
+    regions: Optional[FlashRegionIndex],
+    n_samples: int = 8,
+    interval: float = 5.0,
+    stopped: Callable[[], bool] = lambda: False,
+) -> Tuple[bool, int]:
+    """Watch the QSPI reads of a target that has read XIP data.
+
+    Occasionally, the glitch forces weird unwanted behavior that can be
+    heuristically detected from the highest address accessed on the QSPI bus.
+    These heuristics require a region index.
+
+    Args:
+        ctrl (FpgaController): Interface to the gateware.
+        regions (Optional[FlashRegionIndex]): Region index of the monitored flash.
+        n_samples (int, optional): Number of samples of the highest address. Defaults to 8.
+        interval (float, optional): Interval between two samples (seconds). Defaults to 5.0.
+        stopped (Callable[[], bool], optional): Polled before each sample, watching
+            is cut short once it returns True.
+
+    Returns:
+        Tuple[bool, int]: Whether the attempt may still be a success, and the last
+            sample of the highest address.
+    """
+    logger.info("Monitoring QSPI reads")
+    prev_max_address = None
+    for n in range(n_samples):
+        if n:
+            time.sleep(interval)
+            if stopped():
+                break
+
+        max_address = ctrl.get_max_address()
+        logger.info(f"max_address = {describe_address(max_address, regions)}")
+
+        if regions is None:
+            continue
+
+        if _hashes_entire_flash(max_address, regions):
+            logger.warning("Detected SHA-256 mega-loop")
+            return (False, max_address)
+
+        if max_address == prev_max_address and regions.name(max_address).endswith(
+            "signature_block"
+        ):
+            # Not sure what that is, but this common behavior isn't a success
+            logger.warning("Detected reads stalled in the signature block")
+            return (False, max_address)
+
+        prev_max_address = max_address
+
+    return (True, max_address)
+
+
+def precedes_signature_block(address: int, regions: Optional[FlashRegionIndex]) -> bool:
+    """Whether the QSPI reads stopped right before a signature block.
+
+    This fault behavior could indicate a "good" laser positioning.
+    """
+    if regions is None:
+        return False
+    region = regions.lookup(address + 1)
+    return (
+        region is not None
+        and region.start == address + 1
+        and region.name.endswith("signature_block")
+    )
+
+
+def describe_address(address: int, regions: Optional[FlashRegionIndex]) -> str:
+    """Format a flash offset, along with the name of its region if known."""
+    if regions is None:
+        return f"{address:x}"
+    return f"{address:x} ({regions.name(address)})"
+
+
+def _hashes_entire_flash(address: int, regions: FlashRegionIndex) -> bool:
+    """Whether the QSPI reads show the SHA-256 being computed over the entire flash.
+
+    Reads past the end of the image are only conclusive if they cannot belong to
+    the arbitrary firmware. When the index does not describe it, reads at or after
+    its offset are only flagged once they reach the last sector of the flash.
+    """
+    if address < regions.end:
+        return False
+    if address < FIRMWARE_OFFSET:
+        return True
+    if any(region.name == FIRMWARE_REGION for region in regions):
+        return True
+    return address >= FLASH_SIZE - 0x1000
+
+
+def _resynchronize(ctrl: FpgaController, e: ValueError) -> None:
+    logger.error(f"Unexpected reply from the gateware: {e}, resynchronizing")
+    ctrl.reconnect()
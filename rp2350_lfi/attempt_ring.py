@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""Shared memory ring buffer of attempt records."""
+
+import struct
+from enum import IntEnum
+from multiprocessing import shared_memory
+from typing import List, NamedTuple, Optional
+
+from .target_health import RecoveryAction, RecoveryStats
+
+
+class AttemptRecord(NamedTuple):
+    """Fixed-size record of a single glitch attempt.
+
+    Latencies are expressed in seconds, and are NaN when the corresponding event
+    has not been received.
+    """
+
+    number: int  # Attempt number, starting from 0
+    timestamp: float
+    done_latency: float  # From power on to the D event
+    success_latency: float  # From the D event to the S event
+    start_address: int
+    max_address: int
+    delay: int
+    outcome: int
+    paused: bool  # The producer waits for the consumer after this attempt
+
+
+class PauseReason(IntEnum):
+    """Why the producer is paused."""
+
+    NONE = 0
+    ATTEMPT = 1  # An attempt must be assessed, the target is left running
+    RECOVERY = 2  # The target cannot be recovered
+
+
+_RECORD = struct.Struct("<QdddIIHB?4x")
+_COUNTER = struct.Struct("<Q")
+_FLAG = struct.Struct("<I")
+_LATENCY = struct.Struct("<d")
+_RECOVERIES = struct.Struct(f"<{2 * len(RecoveryAction)}Q")  # Actions, then recoveries
+
+# Header layout. Each field is written by a single side, and the head and tail
+# counters are naturally aligned 64-bit words, so no lock is needed.
+_HEAD_OFFSET = 0  # Written by the producer
+_TAIL_OFFSET = 8  # Written by the consumer
+_PAUSED_OFFSET = 16  # Set by the producer, cleared by the consumer
+_STOP_OFFSET = 20  # Written by the consumer
+_DROPPED_OFFSET = 24  # Written by the producer
+_CAPACITY_OFFSET = 32  # Written once, at creation
+_LINK_LATENCY_OFFSET = 40  # Written by the producer
+_RECONNECTS_OFFSET = 48  # Written by the producer
+_RECOVERIES_OFFSET = 64  # Written by the producer
+_HEADER_SIZE = 128
+
+
+class AttemptRing:
+    """Single-producer, single-consumer ring buffer in shared memory.
+
+    The producer only ever writes the head counter, after the record itself,
+    and the consumer only ever writes the tail counter, so neither side has to
+    take a lock. When the ring is full, new records are dropped and counted
+    rather than blocking the producer.
+
+    The header also carries statistics of the producer: the gateware link
+    latency, the reconnections and the recovery actions.
+
+    The ring also carries two flags used to control the producer: "paused" and
+    "stop". The producer pauses by itself, and the consumer resumes it. When it
+    pauses to have an attempt assessed, the reason is set before the record is
+    pushed, so the consumer never resumes it before it has paused.
+    """
+
+    def __init__(self, capacity: int = 4096, name: Optional[str] = None) -> None:
+        """Create a ring, or attach to an existing one.
+
+        Args:
+            capacity (int, optional): Number of records of a new ring. Defaults to 4096.
+            name (Optional[str], optional): Name of the shared memory block of an
+                existing ring. A new ring is created if None. Defaults to None.
+        """
+        if name is None:
+            size = _HEADER_SIZE + capacity * _RECORD.size
+            self._shm = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self._owner = False
+
+        buf = self._shm.buf
+        assert buf is not None  # Only None once closed
+        self._buf: memoryview = buf
+
+        if self._owner:
+            self._buf[:_HEADER_SIZE] = bytes(_HEADER_SIZE)
+            _COUNTER.pack_into(self._buf, _CAPACITY_OFFSET, capacity)
+        self._capacity = self._read_counter(_CAPACITY_OFFSET)
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block, used to attach to the ring."""
+        return self._shm.name
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def push(self, record: AttemptRecord) -> bool:
+        """Append a record (producer side).
+
+        Returns:
+            bool: False if the ring was full and the record has been dropped.
+        """
+        head = self._read_counter(_HEAD_OFFSET)
+        tail = self._read_counter(_TAIL_OFFSET)
+        if head - tail >= self._capacity:
+            dropped = self._read_counter(_DROPPED_OFFSET)
+            _COUNTER.pack_into(self._buf, _DROPPED_OFFSET, dropped + 1)
+            return False
+
+        offset = _HEADER_SIZE + (head % self._capacity) * _RECORD.size
+        _RECORD.pack_into(self._buf, offset, *record)
+        _COUNTER.pack_into(self._buf, _HEAD_OFFSET, head + 1)
+        return True
+
+    def pop(self) -> Optional[AttemptRecord]:
+        """Remove the oldest record (consumer side), if any."""
+        head = self._read_counter(_HEAD_OFFSET)
+        tail = self._read_counter(_TAIL_OFFSET)
+        if head == tail:
+            return None
+
+        offset = _HEADER_SIZE + (tail % self._capacity) * _RECORD.size
+        record = AttemptRecord(*_RECORD.unpack_from(self._buf, offset))
+        _COUNTER.pack_into(self._buf, _TAIL_OFFSET, tail + 1)
+        return record
+
+    def pop_all(self) -> List[AttemptRecord]:
+        """Remove all the available records (consumer side)."""
+        records = []
+        while (record := self.pop()) is not None:
+            records.append(record)
+        return records
+
+    @property
+    def dropped(self) -> int:
+        """Number of records dropped because the ring was full."""
+        return self._read_counter(_DROPPED_OFFSET)
+
+    def publish_link(self, latency: float, reconnects: int) -> None:
+        """Update the gateware link statistics (producer side)."""
+        _LATENCY.pack_into(self._buf, _LINK_LATENCY_OFFSET, latency)
+        _COUNTER.pack_into(self._buf, _RECONNECTS_OFFSET, reconnects)
+
+    @property
+    def link_latency(self) -> float:
+        """Round trip of the last command acknowledged by the gateware (seconds)."""
+        return _LATENCY.unpack_from(self._buf, _LINK_LATENCY_OFFSET)[0]
+
+    @property
+    def reconnects(self) -> int:
+        """Number of reconnections to the gateware."""
+        return self._read_counter(_RECONNECTS_OFFSET)
+
+    def publish_recovery(self, stats: RecoveryStats) -> None:
+        """Update the recovery action counters (producer side)."""
+        _RECOVERIES.pack_into(
+            self._buf,
+            _RECOVERIES_OFFSET,
+            *(stats.actions[action] for action in RecoveryAction),
+            *(stats.recovered[action] for action in RecoveryAction),
+        )
+
+    def recovery_stats(self) -> RecoveryStats:
+        """Snapshot of the recovery action counters.
+
+        Recovery times are not carried by the ring, so they are left empty.
+        """
+        counters = _RECOVERIES.unpack_from(self._buf, _RECOVERIES_OFFSET)
+        stats = RecoveryStats()
+        for action in RecoveryAction:
+            stats.actions[action] = counters[action]
+            stats.recovered[action] = counters[len(RecoveryAction) + action]
+        return stats
+
+    @property
+    def paused(self) -> PauseReason:
+        return PauseReason(_FLAG.unpack_from(self._buf, _PAUSED_OFFSET)[0])
+
+    @paused.setter
+    def paused(self, value: PauseReason) -> None:
+        _FLAG.pack_into(self._buf, _PAUSED_OFFSET, value)
+
+    @property
+    def stop(self) -> bool:
+        return bool(_FLAG.unpack_from(self._buf, _STOP_OFFSET)[0])
+
+    @stop.setter
+    def stop(self, value: bool) -> None:
+        _FLAG.pack_into(self._buf, _STOP_OFFSET, int(value))
+
+    def close(self) -> None:
+        """Detach from the ring, and free it if it has been created here."""
+        del self._buf
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def _read_counter(self, offset: int) -> int:
+        return _COUNTER.unpack_from(self._buf, offset)[0]
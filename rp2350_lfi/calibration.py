@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Attack timing parameters calibration."""
+
+import json
+import statistics
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Sequence
+
+
+@dataclass
+class Calibration:
+    """Timing parameters of the attack loop, in seconds."""
+
+    success_timeout: float = 0.004
+    xip_timeout: float = 1.0
+    poweroff_duration: float = 0.001
+
+    @classmethod
+    def load(cls, path: Path) -> "Calibration":
+        """Load calibration values from a JSON file."""
+        return cls(**json.loads(path.read_text()))
+
+    def save(self, path: Path) -> None:
+        """Save calibration values to a JSON file."""
+        path.write_text(json.dumps(asdict(self), indent=4) + "\n")
+
+
+def recommend_timeout(
+    latencies: Sequence[float], margin: float = 1.5, quantile: float = 0.99
+) -> float:
+    """Recommend a timeout from a distribution of measured latencies.
+
+    Args:
+        latencies (Sequence[float]): Measured latencies (seconds).
+        margin (float, optional): Safety factor applied to the quantile. Defaults to 1.5.
+        quantile (float, optional): Fraction of the latencies the timeout should cover
+            before applying the margin. Defaults to 0.99.
+
+    Returns:
+        float: The recommended timeout (seconds).
+    """
+    if len(latencies) < 2:
+        return margin * max(latencies)
+
+    cut_points = statistics.quantiles(latencies, n=1000, method="inclusive")
+    index = min(len(cut_points) - 1, max(0, round(quantile * 1000) - 1))
+
+    return margin * cut_points[index]
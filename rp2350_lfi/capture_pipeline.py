@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Background capture of the die pictures, indexed by delta stage position."""
+
+import json
+import logging
+import queue
+import threading
+from pathlib import Path
+from typing import Any, Dict, Mapping, Optional, Set, Tuple
+
+from .delta_stage import DeltaStage
+
+logger = logging.getLogger(__name__)
+
+Position = Tuple[int, int, int]
+
+
+def _key(position: Position) -> str:
+    return "_".join(str(v) for v in position)
+
+
+def _position(key: str) -> Position:
+    x, y, z = (int(v) for v in key.split("_"))
+    return (x, y, z)
+
+
+class CapturePipeline:
+    """Take pictures of the die in a background thread.
+
+    Pictures are stored in a directory, along with an index.json file mapping
+    each stage position to its picture and to the number of glitch events
+    recorded there. A position that has already been captured is never
+    captured again.
+    """
+
+    def __init__(
+        self, delta_stage: DeltaStage, directory: Path, max_pending: int = 16
+    ) -> None:
+        """Create a capture pipeline.
+
+        Args:
+            delta_stage (DeltaStage): The delta stage, with its camera.
+            directory (Path): Where the pictures and the index are stored.
+            max_pending (int, optional): Maximum number of queued capture requests.
+                Further requests are dropped. Defaults to 16.
+        """
+        self._delta_stage = delta_stage
+        self._directory = directory
+        self._directory.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._index: Dict[str, Dict[str, Any]] = {}
+        index_file = self._directory / "index.json"
+        if index_file.exists():
+            self._index = json.loads(index_file.read_text())
+        self._pending: Set[str] = set()
+
+        self._queue: "queue.Queue[Optional[Position]]" = queue.Queue(max_pending)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the pipeline, once all the queued captures are done."""
+        self._queue.put(None)
+        self._thread.join()
+        self._save_index()
+
+    def request(self, position: Position) -> bool:
+        """Request a picture at a given position, without blocking.
+
+        Returns:
+            bool: False if the request has been dropped.
+        """
+        key = _key(position)
+        with self._lock:
+            if key in self._pending or "file" in self._index.get(key, {}):
+                return True
+            try:
+                self._queue.put_nowait(position)
+            except queue.Full:
+                return False
+            self._pending.add(key)
+        return True
+
+    def record_event(self, position: Position) -> None:
+        """Count a glitch event at a given position."""
+        with self._lock:
+            entry = self._index.setdefault(_key(position), {})
+            entry["events"] = entry.get("events", 0) + 1
+
+    def get(self, position: Position) -> Optional[Path]:
+        """Get the picture taken at a given position, if any."""
+        with self._lock:
+            filename = self._index.get(_key(position), {}).get("file")
+        return self._directory / filename if filename is not None else None
+
+    def _run(self) -> None:
+        while (position := self._queue.get()) is not None:
+            key = _key(position)
+            try:
+                self._capture(position)
+            except Exception as e:
+                logger.warning(f"Cannot take a picture at {position}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(key)
+
+    def _capture(self, position: Position) -> None:
+        # The stage may have moved since the request
+        if self._delta_stage.get_position() != position:
+            logger.info(f"Stage has moved away from {position}, skipping picture")
+            return
+
+        key = _key(position)
+        capture = self._delta_stage.take_picture(
+            f"lfi_{key}", tags=["lfi"], annotations={"position": key}
+        )
+
+        # The stage may also have started moving while the picture was taken. It
+        # is then dropped, and the position can be captured again later.
+        if self._delta_stage.get_position() != position:
+            logger.info(f"Stage has moved away from {position}, dropping picture")
+            return
+
+        image = self._delta_stage.download_capture(
+            capture["id"], capture.get("name", f"lfi_{key}")
+        )
+
+        filename = f"{key}.jpeg"
+        (self._directory / filename).write_bytes(image)
+
+        with self._lock:
+            self._index.setdefault(key, {})["file"] = filename
+        self._save_index()
+
+    def _save_index(self) -> None:
+        with self._lock:
+            data = json.dumps(self._index, indent=4)
+        tmp = self._directory / "index.json.tmp"
+        tmp.write_text(data + "\n")
+        tmp.replace(self._directory / "index.json")
+
+
+def build_mosaic(
+    directory: Path,
+    output: Path,
+    steps_per_pixel: float,
+    scale: float = 0.125,
+) -> None:
+    """Stitch the pictures of a capture directory into a downsampled die mosaic.
+
+    Each picture is placed according to the stage position it has been taken
+    at. Positions where glitch events have been recorded are overlaid with a
+    red marker, whose opacity grows with the number of events.
+
+    Args:
+        directory (Path): The capture directory.
+        output (Path): The mosaic image.
+        steps_per_pixel (float): Stage steps per pixel of the full size pictures.
+        scale (float, optional): Downsampling factor of the pictures. Defaults to 0.125.
+    """
+    try:
+        from PIL import Image, ImageDraw
+    except ImportError as e:
+        raise RuntimeError("Building a mosaic requires Pillow") from e
+
+    index: Mapping[str, Dict[str, Any]] = json.loads(
+        (directory / "index.json").read_text()
+    )
+
+    tiles = {}
+    for key, entry in index.items():
+        if "file" in entry:
+            with Image.open(directory / entry["file"]) as img:
+                size = (max(1, int(img.width * scale)), max(1, int(img.height * scale)))
+                tiles[_position(key)] = img.convert("RGB").resize(size)
+
+    positions = [_position(key) for key in index]
+    if not positions:
+        raise ValueError("Empty capture directory")
+
+    tile_w = max((t.width for t in tiles.values()), default=1)
+    tile_h = max((t.height for t in tiles.values()), default=1)
+    min_x = min(p[0] for p in positions)
+    min_y = min(p[1] for p in positions)
+
+    def to_pixel(position: Position) -> Tuple[int, int]:
+        return (
+            int((position[0] - min_x) * scale / steps_per_pixel),
+            int((position[1] - min_y) * scale / steps_per_pixel),
+        )
+
+    width = max(to_pixel(p)[0] for p in positions) + tile_w
+    height = max(to_pixel(p)[1] for p in positions) + tile_h
+
+    mosaic = Image.new("RGBA", (width, height))
+    for position, tile in tiles.items():
+        mosaic.paste(tile, to_pixel(position))
+
+    overlay = Image.new("RGBA", mosaic.size)
+    draw = ImageDraw.Draw(overlay)
+    max_events = max((e.get("events", 0) for e in index.values()), default=0)
+    radius = max(2, min(tile_w, tile_h) // 8)
+    for key, entry in index.items():
+        events = entry.get("events", 0)
+        if not events:
+            continue
+        x, y = to_pixel(_position(key))
+        x += tile_w // 2
+        y += tile_h // 2
+        alpha = int(64 + 191 * events / max_events)
+        draw.ellipse(
+            (x - radius, y - radius, x + radius, y + radius), fill=(255, 0, 0, alpha)
+        )
+
+    Image.alpha_composite(mosaic, overlay).convert("RGB").save(output)
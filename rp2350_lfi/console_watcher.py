@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Detection of the console of the arbitrary firmware."""
+
+import os
+import re
+import select
+import termios
+import threading
+import time
+import tty
+from typing import Optional
+
+
+class ConsoleWatcher:
+    """Watch the console of the arbitrary firmware in a background thread.
+
+    The console device only exists once the arbitrary firmware runs and its USB
+    CDC interface has been enumerated. It is therefore polled for, and reopened
+    every time it disappears.
+    """
+
+    # Output of arbitrary_firmware/firmware.c, including the OTP guarded data
+    PATTERN = rb"Success!\r?\n([0-9A-F]{8})\r?\n"
+
+    def __init__(
+        self,
+        path: str = "/dev/ttyACM0",
+        pattern: bytes = PATTERN,
+        poll_interval: float = 0.005,
+    ) -> None:
+        """Create a console watcher.
+
+        Args:
+            path (str, optional): The console device. Defaults to "/dev/ttyACM0".
+            pattern (bytes, optional): Regular expression matching the output of a
+                successful attack. Defaults to PATTERN.
+            poll_interval (float, optional): How often to check for the device
+                (seconds). Defaults to 0.005.
+        """
+        self._path = path
+        self._pattern = re.compile(pattern)
+        self._poll_interval = poll_interval
+
+        self._lock = threading.Lock()
+        self._buffer = b""
+        self._match: Optional[str] = None
+        self._matched = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        """Start watching the console."""
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching the console."""
+        self._stop.set()
+        self._thread.join()
+
+    def clear(self) -> None:
+        """Forget everything received so far."""
+        with self._lock:
+            self._buffer = b""
+            self._match = None
+            self._matched.clear()
+
+    def wait(self, timeout: float) -> Optional[str]:
+        """Wait for the console to print the output of a successful attack.
+
+        Args:
+            timeout (float): How long to wait (seconds).
+
+        Returns:
+            Optional[str]: The matching output, or None if nothing has been received.
+        """
+        if not self._matched.wait(timeout):
+            return None
+        with self._lock:
+            return self._match
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                fd = os.open(self._path, os.O_RDONLY | os.O_NOCTTY | os.O_NONBLOCK)
+            except OSError:
+                time.sleep(self._poll_interval)
+                continue
+
+            try:
+                if os.isatty(fd):
+                    tty.setraw(fd, termios.TCSANOW)
+                self._read(fd)
+            except OSError:
+                pass  # The device has disappeared
+            finally:
+                os.close(fd)
+
+    def _read(self, fd: int) -> None:
+        while not self._stop.is_set():
+            ready, _, _ = select.select([fd], [], [], 0.1)
+            if not ready:
+                continue
+
+            data = os.read(fd, 4096)
+            if not data:
+                return
+
+            with self._lock:
+                self._buffer = (self._buffer + data)[-4096:]
+                if self._match is None:
+                    m = self._pattern.search(self._buffer)
+                    if m is not None:
+                        self._match = m.group(0).decode(errors="replace").strip()
+                        self._matched.set()
@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """Delta Stage controller."""
 import time
-from typing import Tuple
+from typing import Any, Dict, Optional, Sequence, Tuple
 
 import requests
 
@@ -38,17 +38,55 @@ class DeltaStage:
         time.sleep(0.8)
         self.get_position()
 
-    def take_picture(self, filename: str) -> None:
+    def take_picture(
+        self,
+        filename: str,
+        tags: Sequence[str] = ("scan",),
+        annotations: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        """Take a picture with the camera of the microscope.
+
+        Args:
+            filename (str): Name of the capture, on the microscope side.
+            tags (Sequence[str], optional): Tags of the capture. Defaults to ("scan",).
+            annotations (Optional[Dict[str, str]], optional): Annotations of the capture.
+                Defaults to None.
+
+        Returns:
+            Dict[str, Any]: Description of the capture.
+        """
         payload = {
             "use_video_port": False,
             "temporary": False,
             "filename": filename,
             "bayer": False,
-            "tags": ["scan"],
-            "annotations": {"Client": "SwaggerUI"},
+            "tags": list(tags),
+            "annotations": annotations or {},
         }
 
         url = f"http://{self._host}:5000/api/v2/actions/camera/capture/"
 
         r = requests.post(url, json=payload)
         r.raise_for_status()
+
+        ret = r.json()
+
+        # Actions return a description of the task, whose output is the capture
+        return ret.get("output", ret)
+
+    def download_capture(self, capture_id: str, filename: str) -> bytes:
+        """Download the image of a capture.
+
+        Args:
+            capture_id (str): ID of the capture.
+            filename (str): Name of the capture.
+
+        Returns:
+            bytes: The image.
+        """
+        url = f"http://{self._host}:5000/api/v2/captures/{capture_id}/download/{filename}"
+
+        r = requests.get(url)
+        r.raise_for_status()
+
+        return r.content
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""Index of the regions of a flash image."""
+
+import json
+from bisect import bisect_right
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence
+
+# Flash offset of the arbitrary firmware, must match the jumper shellcode
+FIRMWARE_OFFSET = 0x10000
+FIRMWARE_REGION = "arbitrary_firmware"  # Name of the arbitrary firmware region
+FLASH_SIZE = 0x1000000  # Size of the QSPI flash components (16 MiB)
+
+
+@dataclass(frozen=True)
+class FlashRegion:
+    """A named [start, end) range of flash offsets."""
+
+    start: int
+    end: int
+    name: str
+
+
+class FlashRegionIndex:
+    """Sorted, non-overlapping list of flash regions, searchable by address."""
+
+    def __init__(self, regions: Sequence[FlashRegion]) -> None:
+        """Create an index.
+
+        Args:
+            regions (Sequence[FlashRegion]): Non-overlapping regions.
+        """
+        self._regions = sorted(regions, key=lambda r: r.start)
+        self._starts = [r.start for r in self._regions]
+
+        for a, b in zip(self._regions, self._regions[1:]):
+            if a.end > b.start:
+                raise ValueError(f"Overlapping regions: {a}, {b}")
+
+    @classmethod
+    def from_layers(cls, layers: Sequence[FlashRegion]) -> "FlashRegionIndex":
+        """Create an index from possibly overlapping regions.
+
+        Where regions overlap, the one appearing last in the list wins. Adjacent
+        ranges with the same name are merged.
+
+        Args:
+            layers (Sequence[FlashRegion]): Regions, from bottom to top layer.
+        """
+        bounds = sorted({b for r in layers for b in (r.start, r.end)})
+
+        regions: List[FlashRegion] = []
+        for start, end in zip(bounds, bounds[1:]):
+            name = None
+            for r in reversed(layers):
+                if r.start <= start and end <= r.end:
+                    name = r.name
+                    break
+            if name is None:
+                continue
+            if regions and regions[-1].name == name and regions[-1].end == start:
+                regions[-1] = FlashRegion(regions[-1].start, end, name)
+            else:
+                regions.append(FlashRegion(start, end, name))
+
+        return cls(regions)
+
+    @classmethod
+    def load(cls, path: Path) -> "FlashRegionIndex":
+        """Load an index from a JSON file."""
+        return cls([FlashRegion(**r) for r in json.loads(path.read_text())])
+
+    def save(self, path: Path) -> None:
+        """Save the index to a JSON file."""
+        path.write_text(json.dumps([asdict(r) for r in self._regions], indent=4) + "\n")
+
+    def lookup(self, address: int) -> Optional[FlashRegion]:
+        """Find the region containing a flash offset, if any."""
+        i = bisect_right(self._starts, address) - 1
+        if i >= 0 and address < self._regions[i].end:
+            return self._regions[i]
+        return None
+
+    def name(self, address: int) -> str:
+        """Name the region containing a flash offset."""
+        region = self.lookup(address)
+        return region.name if region is not None else "unmapped"
+
+    @property
+    def end(self) -> int:
+        """End of the last region, 0 if the index is empty."""
+        return self._regions[-1].end if self._regions else 0
+
+    def __iter__(self) -> Iterator[FlashRegion]:
+        return iter(self._regions)
+
+    def __len__(self) -> int:
+        return len(self._regions)
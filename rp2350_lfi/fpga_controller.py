@@ -1,99 +1,401 @@
 #!/usr/bin/env python3
 """Interface to the Gateware running in the the Glasgow board."""
 
+import logging
+import math
 import socket
 import struct
+import time
+from dataclasses import dataclass
+from enum import IntFlag
+from typing import Callable, List, Optional, Sequence, Tuple, TypeVar
+
+from .qspi_trace import QspiTrace
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class FpgaLinkError(ConnectionError):
+    """The connection to the gateware has been lost."""
+
+    pass
+
+
+class FpgaCapabilityError(RuntimeError):
+    """The gateware does not support a command."""
+
+    pass
+
+
+class Capability(IntFlag):
+    """Optional features of the gateware, reported by the "?" command."""
+
+    SCHEDULE = 1  # T and t commands, schedule index in D events
+    ACCESS_TRACE = 2  # B command
+
+
+@dataclass
+class ScheduleEntry:
+    """Glitch engine configuration for a single attempt.
+
+    The trigger delay is expressed in clock cycles. Each additional laser pulse
+    is described by its offset from the trigger and its width, also expressed
+    in clock cycles.
+    """
+
+    delay: int
+    pulses: Sequence[Tuple[int, int]] = ()
 
 
 class FpgaController:
     """Interface to the gateware running in the Glasgow board."""
 
-    def __init__(self) -> None:
-        """Create an interface to the Gateware."""
-        self._s = socket.socket()
-        self._s.connect(("127.0.0.1", 3334))
+    SCHEDULE_SIZE = 1024  # Maximum number of entries of a schedule
+    PROBE_TIMEOUT = 0.2  # How long to wait for the reply to the "?" command (seconds)
+    DRAIN_TIMEOUT = 0.05  # Silence ending the stale input of a connection (seconds)
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 3334,
+        max_reconnect_delay: float = 30.0,
+    ) -> None:
+        """Create an interface to the Gateware.
+
+        Args:
+            host (str, optional): Host running the Glasgow applet. Defaults to "127.0.0.1".
+            port (int, optional): TCP port of the Glasgow applet. Defaults to 3334.
+            max_reconnect_delay (float, optional): Upper bound of the backoff delay between
+                two reconnection attempts (seconds). Defaults to 30.0.
+        """
+        self._address = (host, port)
+        self._max_reconnect_delay = max_reconnect_delay
+
+        # Last values written to the gateware, replayed after a reconnection
+        self._bootsel: Optional[bool] = None
+        self._run: Optional[bool] = None
+        self._flash_index: Optional[int] = None
+        self._trigger_delay: Optional[int] = None
+        self._schedule: Optional[List[ScheduleEntry]] = None
+        self._schedule_offset = 0  # Index of the first entry uploaded to the gateware
+        self._armed = False
+        self._capabilities: Optional[Capability] = None
+
+        self.schedule_consumed = 0  # Number of entries used since the upload
+        self.reconnect_count = 0
+        self.link_latency = math.nan  # Round trip of the last acknowledged command
+
+        self._sent_at = 0.0
+
+        self._s = socket.create_connection(self._address)
+        self._drain()
+
+    def reconnect(self) -> None:
+        """Reconnect to the gateware and restore its state.
+
+        Reconnection is retried with an exponential backoff until it succeeds.
+        Input left over from the previous connection, such as late glitch events,
+        is discarded. The glitch engine is then cancelled, the target is powered
+        off and the last configured signal levels and trigger delay are sent again.
+        An unexpected reply while doing so fails the reconnection attempt.
+
+        If the glitch engine was armed, the attempt has been interrupted, and
+        the schedule entry it consumed is used again by the next one.
+        """
+        self._s.close()
+
+        if self._armed and self._schedule is not None:
+            self.schedule_consumed -= 1
+        self._armed = False
+
+        delay = 0.1
+        while True:
+            try:
+                self._s = socket.create_connection(self._address, timeout=1.0)
+                self._drain()
+                self._restore_state()
+                break
+            except (OSError, ValueError) as e:  # FpgaLinkError is an OSError as well
+                self._s.close()
+                logger.warning(
+                    f"Cannot reconnect to the gateware ({e}), retrying in {delay:.1f} s"
+                )
+                time.sleep(delay)
+                delay = min(2 * delay, self._max_reconnect_delay)
+
+        self.reconnect_count += 1
+
+    def _drain(self) -> None:
+        """Discard the input left over from a previous connection.
+
+        It is received until the gateware goes silent.
+        """
+        discarded = 0
+        while True:
+            try:
+                self._recv(self.DRAIN_TIMEOUT)
+            except TimeoutError:
+                break
+            discarded += 1
+
+        if discarded:
+            logger.warning(f"Discarded {discarded} stale bytes from the gateware")
+
+    def _restore_state(self) -> None:
+        self.cancel_glitch_engine()
+        self.set_power(False)
+        if self._flash_index is not None:
+            self.select_flash(self._flash_index)
+        if self._bootsel is not None:
+            self.set_bootsel(self._bootsel)
+        if self._run is not None:
+            self.set_run(self._run)
+        if self._trigger_delay is not None:
+            self.set_trigger_delay(self._trigger_delay)
+        if self._schedule is not None:
+            # Resume the schedule where it has been interrupted
+            schedule, consumed = self._schedule, self.schedule_consumed
+            position = consumed % len(schedule)
+            self.upload_schedule(schedule[position:] + schedule[:position])
+            self._schedule = schedule
+            self.schedule_consumed = consumed
+            self._schedule_offset = position
+
+    @property
+    def capabilities(self) -> Capability:
+        """Optional features supported by the gateware.
+
+        They are probed once. A gateware predating the "?" command does not
+        reply with a capability report, and supports none of them.
+        """
+        if self._capabilities is None:
+            self._capabilities = self._probe_capabilities()
+        return self._capabilities
+
+    def _probe_capabilities(self) -> Capability:
+        self._send(b"?")
+        try:
+            r = self._recv(self.PROBE_TIMEOUT)
+        except TimeoutError:
+            r = b""
+
+        if r == b"K":
+            return Capability(self._recv_reply()[0])
+
+        # An older gateware may still reply late, or may have replied with
+        # something else: start over with a clean connection.
+        logger.info("The gateware does not report its capabilities")
+        self.reconnect()
+        return Capability(0)
+
+    def _require(self, capability: Capability) -> None:
+        if capability not in self.capabilities:
+            raise FpgaCapabilityError(
+                f"The gateware does not support {capability.name}"
+            )
 
     def set_power(self, en: bool) -> None:
         if en:
-            self._s.send(b"P")
+            self._send(b"P")
         else:
-            self._s.send(b"p")
+            self._send(b"p")
         self._wait_ack()
 
     def set_bootsel(self, level: bool) -> None:
         if level:
-            self._s.send(b"X")
+            self._send(b"X")
         else:
-            self._s.send(b"x")
+            self._send(b"x")
         self._wait_ack()
+        self._bootsel = level
 
     def set_run(self, level: bool) -> None:
         if level:
-            self._s.send(b"u")
+            self._send(b"u")
         else:
-            self._s.send(b"r")
+            self._send(b"r")
         self._wait_ack()
+        self._run = level
 
     def select_flash(self, index: int) -> None:
         if index == 0:
-            self._s.send(b"f")
+            self._send(b"f")
         else:
-            self._s.send(b"F")
+            self._send(b"F")
         self._wait_ack()
+        self._flash_index = index
+
+    def run_bootloader(self) -> None:
+        """Power cycle the target with BOOTSEL asserted to enter the bootloader."""
+        self.set_power(False)
+        self.set_bootsel(False)
+        self.set_run(False)
+
+        time.sleep(0.1)
+
+        self.set_power(True)
+        self.set_run(True)
+
+        time.sleep(0.1)
+
+        self.set_bootsel(True)
 
     def set_trigger_delay(self, delay: int) -> None:
         payload = b"D" + struct.pack("<H", delay)
-        self._s.send(payload)
+        self._send(payload)
+        self._wait_ack()
+        self._trigger_delay = delay
+
+    def upload_schedule(self, entries: Sequence[ScheduleEntry]) -> None:
+        """Upload a schedule to the glitch engine.
+
+        Each time the glitch engine is armed, it consumes the next entry of the
+        schedule, wrapping around after the last one. While a schedule is loaded,
+        the value set with set_trigger_delay() is ignored, and wait_glitch_done()
+        returns the index of the entry that has been used.
+
+        Args:
+            entries (Sequence[ScheduleEntry]): The schedule.
+
+        Raises:
+            FpgaCapabilityError: The gateware does not support schedules.
+        """
+        self._require(Capability.SCHEDULE)
+        if not 0 < len(entries) <= self.SCHEDULE_SIZE:
+            raise ValueError(f"Invalid schedule size: {len(entries)}")
+
+        payload = b"T" + struct.pack("<H", len(entries))
+        for entry in entries:
+            payload += struct.pack("<HB", entry.delay, len(entry.pulses))
+            for offset, width in entry.pulses:
+                payload += struct.pack("<HH", offset, width)
+
+        self._send(payload)
         self._wait_ack()
+        self._schedule = list(entries)
+        self.schedule_consumed = 0
+        self._schedule_offset = 0
+
+    def clear_schedule(self) -> None:
+        """Unload the schedule, and go back to using the trigger delay."""
+        self._require(Capability.SCHEDULE)
+        self._send(b"t")
+        self._wait_ack()
+        self._schedule = None
 
     def arm_glitch_engine(self) -> None:
-        self._s.send(b"A")
+        self._send(b"A")
         self._wait_ack()
+        self._armed = True
+        if self._schedule is not None:
+            self.schedule_consumed += 1
 
     def cancel_glitch_engine(self) -> None:
-        self._s.send(b"C")
+        self._send(b"C")
         self._wait_ack()
+        self._armed = False
 
-    def wait_glitch_done(self, timeout: float = 1.0) -> None:
-        self._s.settimeout(timeout)
-        r = self._s.recv(1)
+    def wait_glitch_done(self, timeout: float = 1.0) -> Optional[int]:
+        r = self._recv(timeout)
         if r != b"D":
             raise ValueError(f"Invalid value: 0x{r[0]:02x}")
 
+        if self._schedule is None:
+            return None
+
+        index = self._recv_reply()[0]
+        index |= self._recv_reply()[0] << 8
+
+        return (self._schedule_offset + index) % len(self._schedule)
+
     def wait_glitch_success(self, timeout: float = 0.5) -> None:
-        self._s.settimeout(timeout)
-        r = self._s.recv(1)
+        r = self._recv(timeout)
         if r != b"S":
             raise ValueError(f"Invalid value: 0x{r[0]:02x}")
 
     def wait_xip_success(self, timeout: float = 0.5) -> None:
-        self._s.settimeout(timeout)
-        r = self._s.recv(1)
+        r = self._recv(timeout)
         if r != b"X":
             raise ValueError(f"Invalid value: 0x{r[0]:02x}")
 
     def get_start_address(self) -> int:
-        self._s.send(b"G")
-        value = self._s.recv(1)[0]
-        self._s.send(b"H")
-        value |= self._s.recv(1)[0] << 8
-        self._s.send(b"J")
-        value |= self._s.recv(1)[0] << 16
-
-        return value
+        return self._read_address(b"GHJ")
 
     def get_max_address(self) -> int:
-        self._s.send(b"v")
-        value = self._s.recv(1)[0]
-        self._s.send(b"V")
-        value |= self._s.recv(1)[0] << 8
-        self._s.send(b"W")
-        value |= self._s.recv(1)[0] << 16
+        return self._read_address(b"vVW")
+
+    def get_access_trace(self) -> QspiTrace:
+        """Read the flash lines accessed since the glitch engine has been armed.
+
+        Raises:
+            FpgaCapabilityError: The gateware does not record flash accesses.
+        """
+        self._require(Capability.ACCESS_TRACE)
+        self._send(b"B")
+        # A full 16 MiB flash takes 64 KiB of bitmap, which a 16-bit size
+        # cannot express.
+        (size,) = struct.unpack("<I", self._recv_reply(size=4))
+
+        return QspiTrace.from_bitmap(self._recv_reply(size=size))
+
+    def _read_address(self, commands: bytes) -> int:
+        value = 0
+        for n, command in enumerate(commands):
+            self._send(bytes([command]))
+            value |= self._recv_reply()[0] << (8 * n)
 
         return value
 
-    def _wait_ack(self, timeout: float = 0.5) -> None:
+    def _send(self, payload: bytes) -> None:
+        self._sent_at = time.perf_counter()
+        try:
+            self._s.sendall(payload)
+        except OSError as e:
+            raise FpgaLinkError(f"Cannot send to the gateware: {e}") from e
+
+    def _recv(self, timeout: float, size: int = 1) -> bytes:
+        """Receive a given number of bytes.
+
+        A timeout is reported as a TimeoutError, as it is an expected outcome
+        when waiting for glitch events. A closed or broken connection is reported
+        as a FpgaLinkError.
+        """
         self._s.settimeout(timeout)
-        r = self._s.recv(1)
+        data = b""
+        while len(data) < size:
+            try:
+                r = self._s.recv(size - len(data))
+            except TimeoutError:
+                raise
+            except OSError as e:
+                raise FpgaLinkError(f"Cannot receive from the gateware: {e}") from e
+            if not r:
+                raise FpgaLinkError("Connection closed by the gateware")
+            data += r
+        return data
+
+    def _recv_reply(self, timeout: float = 0.5, size: int = 1) -> bytes:
+        """Receive the reply to a command, which is always expected."""
+        try:
+            return self._recv(timeout, size)
+        except TimeoutError as e:
+            raise FpgaLinkError("No reply from the gateware") from e
+
+    def _wait_ack(self, timeout: float = 0.5) -> None:
+        r = self._recv_reply(timeout)
         if r != b"A":
             raise ValueError(f"Invalid value: 0x{r[0]:02x}")
+        self.link_latency = time.perf_counter() - self._sent_at
+
+
+def retry_on_link_error(ctrl: FpgaController, action: Callable[[], T]) -> T:
+    """Run an action, reconnecting to the gateware and retrying it if the link drops."""
+    while True:
+        try:
+            return action()
+        except FpgaLinkError as e:
+            logger.error(f"Lost connection to the gateware ({e}), reconnecting")
+            ctrl.reconnect()
+            logger.info("Connection to the gateware restored, retrying")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Wrapper around the picotool utility."""
+
+import hashlib
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+
+class PicotoolError(Exception):
+    """Base Picotool exception class."""
+
+    pass
+
+
+class Picotool:
+    """Wrapper around the picotool utility."""
+
+    def __init__(self, executable: str = "picotool") -> None:
+        """Create a picotool wrapper.
+
+        Args:
+            executable (str, optional): The picotool executable. Defaults to "picotool".
+        """
+        self._executable = executable
+
+    def wait_for_device(self, timeout: float = 5.0) -> None:
+        """Wait for a target in BOOTSEL mode to be enumerated.
+
+        Args:
+            timeout (float, optional): How long to wait (seconds). Defaults to 5.0.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._run("info")
+                return
+            except PicotoolError:
+                if time.monotonic() > deadline:
+                    raise
+            time.sleep(0.1)
+
+    def load(self, filename: Path, address: int) -> None:
+        """Write a binary image to the flash of the target, and verify it.
+
+        Args:
+            filename (Path): The binary image.
+            address (int): Destination address, in the XIP address space.
+        """
+        self._run("load", "-v", str(filename), "-o", f"0x{address:08x}")
+
+    def read_hash(self, address: int, size: int) -> bytes:
+        """Compute the SHA-256 of a region of the flash of the target.
+
+        Args:
+            address (int): Start address, in the XIP address space.
+            size (int): Size of the region (bytes).
+
+        Returns:
+            bytes: The SHA-256 digest of the region.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            outfile = Path(tmpdir) / "region.bin"
+            self._run(
+                "save",
+                "-r",
+                f"0x{address:08x}",
+                f"0x{address + size:08x}",
+                str(outfile),
+            )
+            # picotool expands the range to 256 byte boundaries
+            data = outfile.read_bytes()[:size]
+
+        return hashlib.sha256(data).digest()
+
+    def _run(self, *args: str) -> None:
+        try:
+            subprocess.run(
+                [self._executable, *args], check=True, capture_output=True, text=True
+            )
+        except FileNotFoundError as e:
+            raise PicotoolError(f"Cannot run {self._executable}") from e
+        except subprocess.CalledProcessError as e:
+            raise PicotoolError(e.stderr.strip() or e.stdout.strip()) from e
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""Compact storage of the QSPI flash accesses of an attempt."""
+
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Tuple
+
+
+def _write_varint(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return (value, pos)
+        shift += 7
+
+
+class QspiTrace:
+    """Set of the flash lines read on the QSPI bus during an attempt.
+
+    The set is stored as a bitmap held in a Python integer, bit n being set if
+    the line starting at address n * LINE_SIZE has been read. Set operations
+    are therefore performed on whole bitmaps at once.
+    """
+
+    LINE_SIZE = 32  # bytes
+
+    def __init__(self, bitmap: int = 0) -> None:
+        """Create a trace.
+
+        Args:
+            bitmap (int, optional): The bitmap of the lines that have been read.
+                Defaults to 0.
+        """
+        self._bitmap = bitmap
+
+    @classmethod
+    def from_bitmap(cls, data: bytes) -> "QspiTrace":
+        """Create a trace from a bitmap, as sent by the gateware (LSB first)."""
+        return cls(int.from_bytes(data, "little"))
+
+    @classmethod
+    def from_addresses(cls, addresses: Iterable[int]) -> "QspiTrace":
+        """Create a trace from a list of flash addresses."""
+        bitmap = 0
+        for address in addresses:
+            bitmap |= 1 << (address // cls.LINE_SIZE)
+        return cls(bitmap)
+
+    @classmethod
+    def from_rle(cls, data: bytes) -> "QspiTrace":
+        """Create a trace from its run-length encoding."""
+        bitmap = 0
+        line = 0
+        pos = 0
+        value = False
+        while pos < len(data):
+            length, pos = _read_varint(data, pos)
+            if value:
+                bitmap |= ((1 << length) - 1) << line
+            line += length
+            value = not value
+        return cls(bitmap)
+
+    def to_bitmap(self) -> bytes:
+        """Encode the trace as a bitmap (LSB first)."""
+        return self._bitmap.to_bytes((self._bitmap.bit_length() + 7) // 8, "little")
+
+    def to_rle(self) -> bytes:
+        """Encode the trace as alternating runs of unread and read lines.
+
+        Each run length is encoded as a varint, the first run being a run of
+        unread lines.
+        """
+        out = bytearray()
+        position = 0
+        for start, end in self.line_ranges():
+            out += _write_varint(start - position)
+            out += _write_varint(end - start)
+            position = end
+        return bytes(out)
+
+    def line_ranges(self) -> List[Tuple[int, int]]:
+        """List the ranges of consecutive read lines, as [start, end) line indices."""
+        ranges = []
+        bitmap = self._bitmap
+        line = 0
+        while bitmap:
+            # Skip unread lines
+            skip = (bitmap & -bitmap).bit_length() - 1
+            bitmap >>= skip
+            line += skip
+            # Count read lines
+            run = (~bitmap & (bitmap + 1)).bit_length() - 1
+            bitmap >>= run
+            ranges.append((line, line + run))
+            line += run
+        return ranges
+
+    def address_ranges(self) -> List[Tuple[int, int]]:
+        """List the ranges of read addresses, as [start, end) flash offsets."""
+        return [
+            (start * self.LINE_SIZE, end * self.LINE_SIZE)
+            for start, end in self.line_ranges()
+        ]
+
+    def diff(self, golden: "QspiTrace") -> Tuple["QspiTrace", "QspiTrace"]:
+        """Compare the trace with a reference one.
+
+        Returns:
+            Tuple[QspiTrace, QspiTrace]: The lines only read in this trace, and the
+                lines only read in the reference trace.
+        """
+        return (self - golden, golden - self)
+
+    def __contains__(self, address: int) -> bool:
+        return bool(self._bitmap >> (address // self.LINE_SIZE) & 1)
+
+    def __len__(self) -> int:
+        return self._bitmap.bit_count()
+
+    def __bool__(self) -> bool:
+        return self._bitmap != 0
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, QspiTrace):
+            return NotImplemented
+        return self._bitmap == other._bitmap
+
+    def __hash__(self) -> int:
+        return hash(self._bitmap)
+
+    def __or__(self, other: "QspiTrace") -> "QspiTrace":
+        return QspiTrace(self._bitmap | other._bitmap)
+
+    def __and__(self, other: "QspiTrace") -> "QspiTrace":
+        return QspiTrace(self._bitmap & other._bitmap)
+
+    def __sub__(self, other: "QspiTrace") -> "QspiTrace":
+        return QspiTrace(self._bitmap & ~other._bitmap)
+
+    def __xor__(self, other: "QspiTrace") -> "QspiTrace":
+        return QspiTrace(self._bitmap ^ other._bitmap)
+
+    def __repr__(self) -> str:
+        ranges = ", ".join(f"0x{s:x}-0x{e - 1:x}" for s, e in self.address_ranges())
+        return f"QspiTrace({ranges})"
+
+
+class QspiTraceStore:
+    """Append-only file of run-length encoded QSPI traces."""
+
+    def __init__(self, path: Path) -> None:
+        """Open a trace file for appending.
+
+        Args:
+            path (Path): The trace file.
+        """
+        self._path = path
+        self._f: BinaryIO = path.open("ab")
+
+    def append(self, attempt: int, outcome: int, trace: QspiTrace) -> None:
+        """Store the trace of an attempt."""
+        rle = trace.to_rle()
+        self._f.write(
+            _write_varint(attempt) + _write_varint(outcome) + _write_varint(len(rle))
+        )
+        self._f.write(rle)
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+    @staticmethod
+    def read(path: Path) -> Iterator[Tuple[int, int, QspiTrace]]:
+        """Iterate over the (attempt, outcome, trace) records of a trace file."""
+        data = path.read_bytes()
+        pos = 0
+        while pos < len(data):
+            attempt, pos = _read_varint(data, pos)
+            outcome, pos = _read_varint(data, pos)
+            length, pos = _read_varint(data, pos)
+            yield (attempt, outcome, QspiTrace.from_rle(data[pos : pos + length]))
+            pos += length
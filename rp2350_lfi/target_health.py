@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""Target health monitoring and recovery."""
+
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Callable, List, Optional
+
+from .attempt import AttemptOutcome
+from .fpga_controller import FpgaController
+
+logger = logging.getLogger(__name__)
+
+
+class RecoveryAction(IntEnum):
+    """Recovery actions, by increasing order of escalation."""
+
+    POWER_CYCLE = 0
+    RESET = 1
+    BOOTLOADER = 2
+    PAUSE = 3
+
+
+@dataclass
+class RecoveryStats:
+    """Statistics about the recovery actions."""
+
+    actions: Counter = field(default_factory=Counter)
+    recovered: Counter = field(default_factory=Counter)
+    recovery_times: List[float] = field(default_factory=list)
+
+    def recovery_rate(self, action: RecoveryAction) -> float:
+        """Fraction of the given actions after which the target has recovered."""
+        if self.actions[action] == 0:
+            return 0.0
+        return self.recovered[action] / self.actions[action]
+
+
+class TargetHealthMonitor:
+    """Track unhealthy attempt outcomes and escalate recovery actions.
+
+    Every `threshold` consecutive unhealthy outcomes, the next recovery action is
+    performed: a power cycle with a longer off time, a reset through the RUN signal,
+    the full bootloader sequence and finally a pause of the attack.
+    """
+
+    def __init__(
+        self,
+        ctrl: FpgaController,
+        on_pause: Callable[[], None],
+        threshold: int = 5,
+        poweroff_duration: float = 0.5,
+    ) -> None:
+        """Create a health monitor.
+
+        Args:
+            ctrl (FpgaController): Interface to the gateware.
+            on_pause (Callable[[], None]): Called when all other recovery actions have
+                failed. Expected to return once the attack can be resumed.
+            threshold (int, optional): Number of consecutive unhealthy outcomes before
+                escalating. Defaults to 5.
+            poweroff_duration (float, optional): Off time of the recovery power
+                cycle (seconds). Defaults to 0.5.
+        """
+        self._ctrl = ctrl
+        self._on_pause = on_pause
+        self._threshold = threshold
+        self._poweroff_duration = poweroff_duration
+
+        self._n_unhealthy = 0
+        self._next_action = RecoveryAction.POWER_CYCLE
+        self._last_action: Optional[RecoveryAction] = None
+        self._unhealthy_since = 0.0
+
+        self.stats = RecoveryStats()
+
+    def record(self, outcome: AttemptOutcome) -> None:
+        """Record the outcome of an attempt, and recover the target if needed."""
+        if outcome.healthy:
+            if self._last_action is not None:
+                recovery_time = time.monotonic() - self._unhealthy_since
+                logger.info(
+                    f"Target recovered after {self._last_action.name} "
+                    f"({recovery_time:.1f} s)"
+                )
+                self.stats.recovered[self._last_action] += 1
+                self.stats.recovery_times.append(recovery_time)
+            self._n_unhealthy = 0
+            self._next_action = RecoveryAction.POWER_CYCLE
+            self._last_action = None
+            return
+
+        if self._n_unhealthy == 0 and self._last_action is None:
+            self._unhealthy_since = time.monotonic()
+        self._n_unhealthy += 1
+
+        if self._n_unhealthy >= self._threshold:
+            self._n_unhealthy = 0
+            self._recover(self._next_action)
+
+    def _recover(self, action: RecoveryAction) -> None:
+        logger.warning(f"Target is unhealthy, recovery action: {action.name}")
+        self.stats.actions[action] += 1
+        self._last_action = action
+
+        self._ctrl.cancel_glitch_engine()
+
+        if action == RecoveryAction.POWER_CYCLE:
+            self._ctrl.set_power(False)
+            time.sleep(self._poweroff_duration)
+        elif action == RecoveryAction.RESET:
+            # RUN only resets a powered target
+            self._ctrl.set_power(True)
+            self._ctrl.set_run(False)
+            time.sleep(self._poweroff_duration)
+            self._ctrl.set_run(True)
+            time.sleep(self._poweroff_duration)
+        elif action == RecoveryAction.BOOTLOADER:
+            self._ctrl.run_bootloader()
+            time.sleep(self._poweroff_duration)
+            self._ctrl.set_bootsel(True)
+            self._ctrl.set_run(True)
+        elif action == RecoveryAction.PAUSE:
+            logger.critical("Target cannot be recovered, pausing the attack")
+            self._ctrl.set_power(False)
+            self._on_pause()
+
+        # Attempts start with an unpowered target
+        self._ctrl.set_power(False)
+
+        if action == RecoveryAction.PAUSE:
+            self._next_action = RecoveryAction.POWER_CYCLE
+        else:
+            self._next_action = RecoveryAction(action + 1)
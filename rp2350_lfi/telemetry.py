@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""Live telemetry of an attack campaign, in the OpenMetrics text format."""
+
+import logging
+import math
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from .attempt import AttemptOutcome
+from .target_health import RecoveryAction, RecoveryStats
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _value(value: float) -> str:
+    return "NaN" if math.isnan(value) else str(value)
+
+
+class Telemetry:
+    """Counters of an attack campaign.
+
+    The counters are plain attributes, written by the attack loop only and read
+    by the exporter thread. Each of them is updated atomically, so no lock is
+    taken on the attempt path.
+    """
+
+    def __init__(
+        self,
+        rig: Optional[str] = None,
+        recovery: Optional[RecoveryStats] = None,
+    ) -> None:
+        """Create the counters of a campaign.
+
+        Args:
+            rig (Optional[str], optional): Name of the rig, used to label the metrics.
+                The host name is used if None. Defaults to None.
+            recovery (Optional[RecoveryStats], optional): Statistics of the target
+                health monitor. Defaults to None.
+        """
+        self.rig = rig if rig is not None else socket.gethostname()
+        self.recovery = recovery
+
+        self.attempts = 0
+        self.outcomes: List[int] = [0] * len(AttemptOutcome)
+        self.delay = 0
+        self.laser_voltage = math.nan
+        self.position: Optional[Tuple[int, int, int]] = None
+        self.link_latency = math.nan  # Round trip of a command to the gateware
+        self.reconnects = 0
+
+    def record(self, outcome: AttemptOutcome, delay: int) -> None:
+        """Count an attempt."""
+        self.outcomes[outcome] += 1
+        self.delay = delay
+        self.attempts += 1
+
+    def render(self, attempt_rate: float) -> str:
+        """Render the metrics.
+
+        Args:
+            attempt_rate (float): Attempts per second, measured by the caller.
+
+        Returns:
+            str: The metrics, in the OpenMetrics text format.
+        """
+        rig = f'rig="{self.rig}"'
+        recovery = self.recovery
+        lines = [
+            "# TYPE rp2350_lfi_attempts counter",
+            f"rp2350_lfi_attempts_total{{{rig}}} {self.attempts}",
+            "# TYPE rp2350_lfi_attempt_rate gauge",
+            f"rp2350_lfi_attempt_rate{{{rig}}} {attempt_rate:.3f}",
+            "# TYPE rp2350_lfi_outcomes counter",
+        ]
+        for outcome in AttemptOutcome:
+            lines.append(
+                f'rp2350_lfi_outcomes_total{{{rig},outcome="{outcome.name.lower()}"}} '
+                f"{self.outcomes[outcome]}"
+            )
+
+        lines += [
+            "# TYPE rp2350_lfi_trigger_delay gauge",
+            f"rp2350_lfi_trigger_delay{{{rig}}} {self.delay}",
+            "# TYPE rp2350_lfi_laser_voltage gauge",
+            f"rp2350_lfi_laser_voltage{{{rig}}} {_value(self.laser_voltage)}",
+            "# TYPE rp2350_lfi_link_latency_seconds gauge",
+            "# UNIT rp2350_lfi_link_latency_seconds seconds",
+            f"rp2350_lfi_link_latency_seconds{{{rig}}} {_value(self.link_latency)}",
+            "# TYPE rp2350_lfi_reconnects counter",
+            f"rp2350_lfi_reconnects_total{{{rig}}} {self.reconnects}",
+        ]
+
+        position = self.position
+        if position is not None:
+            lines.append("# TYPE rp2350_lfi_stage_position gauge")
+            for axis, value in zip("xyz", position):
+                lines.append(
+                    f'rp2350_lfi_stage_position{{{rig},axis="{axis}"}} {value}'
+                )
+
+        if recovery is not None:
+            lines.append("# TYPE rp2350_lfi_recoveries counter")
+            for action in RecoveryAction:
+                lines.append(
+                    f'rp2350_lfi_recoveries_total{{{rig},action="{action.name.lower()}"}} '
+                    f"{recovery.actions[action]}"
+                )
+            lines.append("# TYPE rp2350_lfi_recovered counter")
+            for action in RecoveryAction:
+                lines.append(
+                    f'rp2350_lfi_recovered_total{{{rig},action="{action.name.lower()}"}} '
+                    f"{recovery.recovered[action]}"
+                )
+
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+class TelemetryExporter:
+    """Export telemetry periodically, over HTTP and/or to a file.
+
+    A background thread samples the counters every `interval` seconds, derives
+    the attempt rate, and rewrites the metrics file. The HTTP server, if any,
+    serves the last sample at /metrics.
+    """
+
+    def __init__(
+        self,
+        telemetry: Telemetry,
+        port: Optional[int] = None,
+        path: Optional[Path] = None,
+        interval: float = 1.0,
+        host: str = "127.0.0.1",
+    ) -> None:
+        """Create an exporter.
+
+        Args:
+            telemetry (Telemetry): The counters to export.
+            port (Optional[int], optional): TCP port of the HTTP endpoint. No endpoint
+                is created if None. Defaults to None.
+            path (Optional[Path], optional): Metrics file, rewritten at each sample.
+                Defaults to None.
+            interval (float, optional): Sampling interval (seconds). Defaults to 1.0.
+            host (str, optional): Address the HTTP endpoint listens on.
+                Defaults to "127.0.0.1".
+        """
+        self._telemetry = telemetry
+        self._path = path
+        self._interval = interval
+
+        self._metrics = telemetry.render(0.0)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._server_thread: Optional[threading.Thread] = None
+        if port is not None:
+            self._server = ThreadingHTTPServer((host, port), self._handler())
+            self._server.daemon_threads = True
+            self._server_thread = threading.Thread(
+                target=self._server.serve_forever, daemon=True
+            )
+
+    @property
+    def address(self) -> Optional[Tuple[str, int]]:
+        """Address of the HTTP endpoint, if any."""
+        if self._server is None:
+            return None
+        host, port = self._server.server_address[:2]
+        return (str(host), port)
+
+    def start(self) -> None:
+        """Start exporting."""
+        self._thread.start()
+        if self._server_thread is not None:
+            self._server_thread.start()
+
+    def stop(self) -> None:
+        """Stop exporting, after a last sample."""
+        self._stop.set()
+        self._thread.join()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def _run(self) -> None:
+        last_attempts = self._telemetry.attempts
+        last_time = time.monotonic()
+
+        while True:
+            stopped = self._stop.wait(self._interval)
+
+            attempts = self._telemetry.attempts
+            now = time.monotonic()
+            rate = (attempts - last_attempts) / (now - last_time)
+            last_attempts, last_time = attempts, now
+
+            self._metrics = self._telemetry.render(rate)
+            if self._path is not None:
+                try:
+                    tmp = self._path.with_name(self._path.name + ".tmp")
+                    tmp.write_text(self._metrics)
+                    tmp.replace(self._path)
+                except OSError as e:
+                    logger.warning(f"Cannot write the metrics file: {e}")
+
+            if stopped:
+                return
+
+    def _handler(self) -> type:
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = exporter._metrics.encode()
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args) -> None:
+                pass  # Scrapes would flood the attack log
+
+        return Handler